@@ -1,24 +1,30 @@
 from pathlib import Path
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, Response
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 from fastapi import APIRouter
-from typing import Optional, List
+from typing import AsyncIterator, Optional, List
 from contextlib import asynccontextmanager
 import uvicorn
+import asyncio
 import logging
 from datetime import datetime, timezone
 import os
-import urllib.parse
+import orjson
 from prometheus_client.core import REGISTRY
 from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
+from clean_html import shutdown_process_pool
+from load_html import close_async_client
 from metrics_collector import RedisModelCollector, RedisQueueCollector
 from data_models import EvaluationRun, ParserGeneratorConfig, URL, URLPrefix, URLPrefixWithUrls, SampleURL, URLQueueItem
-from db import count, load, scan, delete_all, get_production_config, set_production_config, get_system_state, set_system_state, is_system_running, delete
-from redis_queue import add_to_queue, queue_length
+from db import count_many, load, load_many, scan_batches, find_runs_for_url, list_evaluated_urls, find_urls_with_prefix, delete_all, get_production_config, set_production_config, get_system_state, set_system_state, is_system_running, delete, delete_many
+from redis_queue import add_to_queue, queue_lengths
+from redis_utils import close_async_pool
+from paths import CONFIGS_PATH
+from reindex import ensure_indexes
 
 
 # Request model for adding URLPrefix to queue
@@ -34,23 +40,60 @@ class AddURLQueueItemRequest(BaseModel):
     times_queued: int = 0
 
 
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson instead of the stdlib json module"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+async def stream_json_array(batches: AsyncIterator[list[BaseModel]]) -> StreamingResponse:
+    """Stream batches of models as a single JSON array, so the full list is never held in memory.
+
+    The first batch is fetched before the response is returned, so an error reading it still reaches the
+    caller (and becomes a 500). An error on a later batch ends the stream with a truncated body instead.
+    """
+    first_batch = await anext(batches, None)
+
+    async def body():
+        opened = False
+        batch = first_batch
+        while batch is not None:
+            if batch:
+                chunk = b",".join(model.__pydantic_serializer__.to_json(model, by_alias=True) for model in batch)
+                yield (b"," if opened else b"[") + chunk
+                opened = True
+            batch = await anext(batches, None)
+        yield b"]" if opened else b"[]"
+    return StreamingResponse(body(), media_type="application/json")
+
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+model_collector = RedisModelCollector(count_many, [EvaluationRun, URLPrefix, URL])
+queue_collector = RedisQueueCollector(queue_lengths, [URLQueueItem, URLPrefix])
+
+
 # Lifespan context manager for startup/shutdown events
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan context manager"""
     # Startup
     logger.info("Starting LLM-based crawler API...")
-    REGISTRY.register(RedisModelCollector(count, [EvaluationRun, URLPrefix, URL]))
-    REGISTRY.register(RedisQueueCollector(queue_length, [URLQueueItem, URLPrefix]))
+    app.state.index_etag = _index_etag() if SERVE_STATIC else None
+    for collector in (model_collector, queue_collector):
+        try:
+            REGISTRY.register(collector)
+        except ValueError:
+            # Already registered by an earlier startup in this process
+            pass
     
     # Initialize production config if none is set
     try:
-        current_production_config = get_production_config()
+        current_production_config = await get_production_config()
         if not current_production_config:
             # Get all available config files and sort them alphabetically
             config_files = list(Path(__file__).parent.parent.glob("configs/*.yaml"))
@@ -58,7 +101,7 @@ async def lifespan(app: FastAPI):
                 # Sort by filename (stem) alphabetically
                 config_files.sort(key=lambda x: x.stem)
                 first_config_name = config_files[0].stem
-                set_production_config(first_config_name)
+                await set_production_config(first_config_name)
                 logger.info(f"No production config set. Automatically set '{first_config_name}' as production config.")
             else:
                 logger.warning("No config files found in configs/ directory")
@@ -67,9 +110,19 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"Error initializing production config: {str(e)}")
     
+    # Lists, counts and deletes go through the id sets, so build them for data stored before they existed
+    try:
+        if await ensure_indexes():
+            logger.info("Backfilled the Redis id sets and indexes")
+    except Exception as e:
+        logger.error(f"Error backfilling the Redis id sets and indexes: {str(e)}")
+    
     yield
     # Shutdown
     logger.info("Shutting down LLM-based crawler API...")
+    shutdown_process_pool()
+    await close_async_pool()
+    await close_async_client()
 
 
 # Initialize FastAPI app
@@ -77,14 +130,32 @@ app = FastAPI(
     title="LLM-based crawler API",
     description="A FastAPI-based API for the LLM-based crawler project",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 
+class APICORSMiddleware(CORSMiddleware):
+    """CORSMiddleware that only handles /api requests; the frontend and its assets are same-origin"""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# Origins allowed to call the API from another host, e.g. the Vite dev server
+CORS_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("CORS_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173").split(",")
+    if origin.strip()
+]
+
 # Add CORS middleware
 app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Configure this properly for production
+    APICORSMiddleware,
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -94,19 +165,41 @@ app.add_middleware(
 FRONTEND_DIST = Path(__file__).parent.parent / "frontend" / "dist"
 INDEX_FILE = FRONTEND_DIST / "index.html"
 
-# Serve static assets (e.g. dist/assets/...) at /assets
-app.mount(
-    "/assets",
-    StaticFiles(directory=FRONTEND_DIST / "assets", check_dir=False),
-    name="assets",
-)
+# Set SERVE_STATIC=0 when a reverse proxy serves frontend/dist directly (see README)
+SERVE_STATIC = os.getenv("SERVE_STATIC", "1").lower() in ("1", "true")
+
 
-# Root -> index.html (if built)
-@app.get("/")
-def serve_index():
-    if INDEX_FILE.exists():
-        return FileResponse(INDEX_FILE)
-    return JSONResponse({"detail": "Frontend not built. Run: cd frontend && npm run build"}, status_code=503)
+def _index_etag() -> Optional[str]:
+    """ETag for the built index.html, derived from its mtime and size"""
+    if not INDEX_FILE.exists():
+        return None
+    stat = INDEX_FILE.stat()
+    return f'"{stat.st_mtime_ns ^ stat.st_size:x}"'
+
+
+def _serve_index_file(request: Request):
+    """Serve index.html, answering 304 when the browser already has the current version"""
+    etag = request.app.state.index_etag
+    if etag is None:
+        return ORJSONResponse({"detail": "Frontend not built. Run: cd frontend && npm run build"}, status_code=503)
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return FileResponse(INDEX_FILE, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+if SERVE_STATIC:
+    # Serve static assets (e.g. dist/assets/...) at /assets
+    app.mount(
+        "/assets",
+        StaticFiles(directory=FRONTEND_DIST / "assets", check_dir=False),
+        name="assets",
+    )
+
+    # Root -> index.html (if built)
+    @app.get("/")
+    def serve_index(request: Request):
+        return _serve_index_file(request)
 
 
 # --- API router (keep APIs under /api so static mount can live at "/") ---
@@ -114,24 +207,24 @@ api = APIRouter(prefix="/api")
 
 
 @api.get("/evaluation_runs", response_model=list[EvaluationRun])
-def get_evaluation_runs():
-    return scan(EvaluationRun)
+async def get_evaluation_runs():
+    return await stream_json_array(scan_batches(EvaluationRun))
 
 
 @api.get("/evaluation_runs/{id}", response_model=EvaluationRun)
-def get_evaluation_run(id: str):
-    return load(EvaluationRun, id)
+async def get_evaluation_run(id: str):
+    return await load(EvaluationRun, id)
 
 
 @api.delete("/evaluation_runs/{id}")
-def delete_evaluation_run(id: str):
+async def delete_evaluation_run(id: str):
     """Delete a specific evaluation run by ID"""
     try:
-        evaluation_run = load(EvaluationRun, id)
+        evaluation_run = await load(EvaluationRun, id)
         if not evaluation_run:
             raise HTTPException(status_code=404, detail=f"Evaluation run '{id}' not found")
         
-        delete(EvaluationRun, id)
+        await delete(EvaluationRun, id)
         return {
             "message": f"Successfully deleted evaluation run '{id}'",
             "deleted_id": id
@@ -144,10 +237,10 @@ def delete_evaluation_run(id: str):
 
 
 @api.delete("/evaluation_runs")
-def clear_evaluation_runs():
+async def clear_evaluation_runs():
     """Clear all evaluation runs from the database"""
     try:
-        deleted_count = delete_all(EvaluationRun)
+        deleted_count = await delete_all(EvaluationRun)
         return {
             "message": f"Cleared {deleted_count} evaluation runs",
             "deleted_count": deleted_count
@@ -157,22 +250,23 @@ def clear_evaluation_runs():
         raise HTTPException(status_code=500, detail="Failed to clear evaluation runs")
 
 
+# Map model names to model classes
+_MODEL_MAP = {
+    "evaluation_runs": EvaluationRun,
+    "urls": URL,
+    # Add other models as needed
+}
+
+
 @api.delete("/data/{model_name}")
-def clear_model_data(model_name: str):
+async def clear_model_data(model_name: str):
     """Clear all data for a specific model type from the database"""
     try:
-        # Map model names to model classes
-        model_map = {
-            "evaluation_runs": EvaluationRun,
-            "urls": URL,
-            # Add other models as needed
-        }
-        
-        if model_name not in model_map:
-            raise HTTPException(status_code=400, detail=f"Unknown model: {model_name}. Available models: {list(model_map.keys())}")
+        if model_name not in _MODEL_MAP:
+            raise HTTPException(status_code=400, detail=f"Unknown model: {model_name}. Available models: {list(_MODEL_MAP.keys())}")
         
-        model_class = model_map[model_name]
-        deleted_count = delete_all(model_class)
+        model_class = _MODEL_MAP[model_name]
+        deleted_count = await delete_all(model_class)
         return {
             "message": f"Cleared {deleted_count} {model_name}",
             "deleted_count": deleted_count,
@@ -186,23 +280,39 @@ def clear_model_data(model_name: str):
 
 
 @api.get("/metrics")
-def metrics():
+async def metrics():
+    await model_collector.refresh()
+    await queue_collector.refresh()
     return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
 # Config routes
+# config name -> (file mtime, config.model_dump(mode="json")); a config file is only reparsed when it changes
+_config_cache: dict[str, tuple[int, dict]] = {}
+
+
+def _load_config_dict(config_name: str) -> dict:
+    """Return a fresh copy of the dumped config, parsing the YAML only if the file changed"""
+    mtime = (CONFIGS_PATH / f"{config_name}.yaml").stat().st_mtime_ns
+    cached = _config_cache.get(config_name)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, ParserGeneratorConfig.from_config(config_name).model_dump(mode="json"))
+        _config_cache[config_name] = cached
+    return dict(cached[1])
+
+
 @api.get("/configs")
-def list_configs():
+async def list_configs():
     """List all available config files"""
     try:
         configs = []
+        production_config = await get_production_config()
         for config_file in Path(__file__).parent.parent.glob("configs/*.yaml"):
             config_name = config_file.stem
             try:
-                config = ParserGeneratorConfig.from_config(config_name)
+                config_dict = _load_config_dict(config_name)
                 # Include the dynamic is_production field in the response
-                config_dict = config.model_dump()
-                config_dict["is_production"] = config.is_production
+                config_dict["is_production"] = config_name == production_config
                 configs.append(config_dict)
             except Exception as e:
                 logger.warning(f"Failed to load config '{config_name}': {str(e)}")
@@ -214,13 +324,12 @@ def list_configs():
 
 
 @api.get("/configs/{config_name}")
-def get_config(config_name: str):
+async def get_config(config_name: str):
     """Get a specific config file by name"""
     try:
-        config = ParserGeneratorConfig.from_config(config_name)
+        config_dict = _load_config_dict(config_name)
         # Include the dynamic is_production field in the response
-        config_dict = config.model_dump()
-        config_dict["is_production"] = config.is_production
+        config_dict["is_production"] = config_name == await get_production_config()
         return config_dict
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail=f"Config '{config_name}' not found")
@@ -230,10 +339,10 @@ def get_config(config_name: str):
 
 
 @api.get("/configs/production/current")
-def get_current_production_config():
+async def get_current_production_config():
     """Get the current production config name"""
     try:
-        production_config = get_production_config()
+        production_config = await get_production_config()
         return {"production_config": production_config}
     except Exception as e:
         logger.error(f"Error getting production config: {str(e)}")
@@ -241,7 +350,7 @@ def get_current_production_config():
 
 
 @api.put("/configs/production/{config_name}")
-def set_production_config_route(config_name: str):
+async def set_production_config_route(config_name: str):
     """Set the production config"""
     try:
         # Verify the config exists
@@ -249,7 +358,7 @@ def set_production_config_route(config_name: str):
         if not config_path.exists():
             raise HTTPException(status_code=404, detail=f"Config '{config_name}' not found")
         
-        set_production_config(config_name)
+        await set_production_config(config_name)
         return {"message": f"Production config set to '{config_name}'", "production_config": config_name}
     except HTTPException:
         raise
@@ -260,25 +369,25 @@ def set_production_config_route(config_name: str):
 
 # System state management endpoints
 @api.get("/system/state")
-def get_system_state_route():
+async def get_system_state_route():
     """Get the current system state"""
     try:
-        state = get_system_state()
-        return {"state": state, "is_running": is_system_running()}
+        state = await get_system_state()
+        return {"state": state, "is_running": await is_system_running()}
     except Exception as e:
         logger.error(f"Error getting system state: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get system state")
 
 
 @api.put("/system/state")
-def set_system_state_route(state: str):
+async def set_system_state_route(state: str):
     """Set the system state to PAUSE or RUNNING"""
     try:
-        set_system_state(state)
+        await set_system_state(state)
         return {
             "message": f"System state set to '{state}'",
             "state": state,
-            "is_running": is_system_running()
+            "is_running": await is_system_running()
         }
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -288,11 +397,11 @@ def set_system_state_route(state: str):
 
 
 @api.post("/urlprefix/queue")
-def add_urlprefix_to_queue(request: AddURLPrefixRequest):
+async def add_urlprefix_to_queue(request: AddURLPrefixRequest):
     """Add a URLPrefix to the queue with only prefix and sample_urls"""
     try:
-        # Convert string URLs to SampleURL objects with loaded raw content
-        sample_urls = [SampleURL.from_url(url) for url in request.sample_urls]
+        # Convert string URLs to SampleURL objects with loaded raw content, fetched concurrently
+        sample_urls = list(await asyncio.gather(*(SampleURL.from_url_async(url) for url in request.sample_urls)))
         
         # Create URLPrefix with only prefix and sample_urls
         url_prefix = URLPrefix(
@@ -301,7 +410,7 @@ def add_urlprefix_to_queue(request: AddURLPrefixRequest):
         )
         
         # Add to queue
-        success = add_to_queue(url_prefix, queue_name="queue:urlprefix")
+        success = await add_to_queue(url_prefix, queue_name="queue:urlprefix")
         
         if not success:
             raise HTTPException(status_code=500, detail="Failed to add URLPrefix to queue")
@@ -320,7 +429,7 @@ def add_urlprefix_to_queue(request: AddURLPrefixRequest):
 
 
 @api.post("/urlqueueitem/queue")
-def add_urlqueueitem_to_queue(request: AddURLQueueItemRequest):
+async def add_urlqueueitem_to_queue(request: AddURLQueueItemRequest):
     """Add a URLQueueItem to the queue"""
     try:
         import time
@@ -341,7 +450,7 @@ def add_urlqueueitem_to_queue(request: AddURLQueueItemRequest):
         )
         
         # Add to queue
-        success = add_to_queue(url_queue_item)
+        success = await add_to_queue(url_queue_item)
         
         if not success:
             raise HTTPException(status_code=500, detail="Failed to add URLQueueItem to queue")
@@ -361,41 +470,28 @@ def add_urlqueueitem_to_queue(request: AddURLQueueItemRequest):
 
 
 @api.get("/urlprefix", response_model=list[URLPrefixWithUrls])
-def get_urlprefix_list():
+async def get_urlprefix_list():
     """Get a list of all URLPrefix objects with all associated URLs"""
     try:
-        urlprefixes = scan(URLPrefix)
-        result = []
-        
-        for urlprefix in urlprefixes:
-            # Create URLPrefixWithUrls to include all associated URLs
-            urlprefix_with_urls = URLPrefixWithUrls.from_url_prefix(urlprefix)
-            result.append(urlprefix_with_urls)
-        
-        return result
+        # Create URLPrefixWithUrls to include all associated URLs, streamed a batch of prefixes at a time
+        return await stream_json_array(URLPrefixWithUrls.from_url_prefix_batches(scan_batches(URLPrefix)))
     except Exception as e:
         logger.error(f"Error retrieving URLPrefix list: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to retrieve URLPrefix list")
 
 
 @api.get("/urlprefix/{prefix_id:path}", response_model=URLPrefixWithUrls)
-def get_urlprefix(prefix_id: str):
+async def get_urlprefix(prefix_id: str):
     """Get a specific URLPrefix by its prefix ID with all associated URLs"""
+    # Path parameters arrive percent-decoded already
+    decoded_prefix = prefix_id
     try:
-        # Decode the URL-encoded prefix_id
-        decoded_prefix = prefix_id
-        try:
-            decoded_prefix = urllib.parse.unquote(prefix_id)
-        except Exception:
-            # If URL decoding fails, use the original
-            pass
-            
-        urlprefix = load(URLPrefix, decoded_prefix)
+        urlprefix = await load(URLPrefix, decoded_prefix)
         if urlprefix is None:
             raise HTTPException(status_code=404, detail=f"URLPrefix with prefix '{decoded_prefix}' not found")
         
         # Create the wrapper with all URLs
-        urlprefix_with_urls = URLPrefixWithUrls.from_url_prefix(urlprefix)
+        urlprefix_with_urls = await URLPrefixWithUrls.from_url_prefix(urlprefix)
         return urlprefix_with_urls
     except HTTPException:
         raise
@@ -405,45 +501,26 @@ def get_urlprefix(prefix_id: str):
 
 
 @api.delete("/urlprefix/{prefix_id:path}")
-def delete_urlprefix(prefix_id: str):
+async def delete_urlprefix(prefix_id: str):
     """Delete a URLPrefix and all its associated URLs"""
+    # Path parameters arrive percent-decoded already
+    decoded_prefix = prefix_id
     try:
-        # Decode the URL-encoded prefix_id
-        decoded_prefix = prefix_id
-        try:
-            decoded_prefix = urllib.parse.unquote(prefix_id)
-        except Exception:
-            # If URL decoding fails, use the original
-            pass
-            
         # Load the URLPrefix to get its associated URLs
-        urlprefix = load(URLPrefix, decoded_prefix)
+        urlprefix = await load(URLPrefix, decoded_prefix)
         if urlprefix is None:
             raise HTTPException(status_code=404, detail=f"URLPrefix with prefix '{decoded_prefix}' not found")
         
-        # Delete all associated URLs
-        deleted_urls_count = 0
-        
-        # Delete URLs from sample_urls
-        for sample_url in urlprefix.sample_urls:
-            if delete(URL, sample_url.url):
-                deleted_urls_count += 1
+        # Collect every associated URL (samples, validation URLs and stored URLs under the prefix)
+        urls = {sample_url.url for sample_url in urlprefix.sample_urls}
+        urls.update(validation_url.url for validation_url in urlprefix.validation_urls or [])
+        urls.update(url_obj.url for url_obj in await find_urls_with_prefix(decoded_prefix))
         
-        # Delete URLs from validation_urls if they exist
-        if urlprefix.validation_urls:
-            for validation_url in urlprefix.validation_urls:
-                if delete(URL, validation_url.url):
-                    deleted_urls_count += 1
-        
-        # Delete URLs from the database that have this prefix
-        from db import find_urls_with_prefix
-        db_urls = find_urls_with_prefix(decoded_prefix)
-        for url_obj in db_urls:
-            if delete(URL, url_obj.url):
-                deleted_urls_count += 1
+        # Delete them all in one round trip
+        deleted_urls_count = await delete_many(URL, urls)
         
         # Delete the URLPrefix itself
-        if not delete(URLPrefix, decoded_prefix):
+        if not await delete(URLPrefix, decoded_prefix):
             raise HTTPException(status_code=500, detail="Failed to delete URLPrefix")
         
         return {
@@ -459,19 +536,13 @@ def delete_urlprefix(prefix_id: str):
 
 
 @api.get("/urls/{url_id:path}")
-def get_url(url_id: str):
+async def get_url(url_id: str):
     """Get a specific URL by its URL"""
+    # Path parameters arrive percent-decoded already
+    decoded_url = url_id
     try:
-        # Decode the URL-encoded url_id
-        decoded_url = url_id
-        try:
-            decoded_url = urllib.parse.unquote(url_id)
-        except Exception:
-            # If URL decoding fails, use the original
-            pass
-            
         # Load the URL object
-        url_obj = load(URL, decoded_url)
+        url_obj = await load(URL, decoded_url)
         if url_obj is None:
             raise HTTPException(status_code=404, detail=f"URL '{decoded_url}' not found")
         
@@ -484,50 +555,37 @@ def get_url(url_id: str):
 
 
 @api.get("/urls")
-def get_urls_list():
+async def get_urls_list():
     """Get a list of all URL objects"""
     try:
-        urls = scan(URL)
-        return urls
+        return await stream_json_array(scan_batches(URL))
     except Exception as e:
         logger.error(f"Error retrieving URLs list: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to retrieve URLs list")
 
 
 @api.get("/urls/evaluated")
-def get_evaluated_urls():
+async def get_evaluated_urls():
     """Get a list of all URLs that have been evaluated"""
     try:
-        evaluation_runs = scan(EvaluationRun)
-        evaluated_urls = set()
-        
-        for run in evaluation_runs:
-            for result in run.results:
-                evaluated_urls.add(result.url)
-        
-        return sorted(list(evaluated_urls))
+        return await list_evaluated_urls()
     except Exception as e:
         logger.error(f"Error retrieving evaluated URLs: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to retrieve evaluated URLs")
 
 
 @api.get("/urls/{url_id:path}/details")
-def get_url_details(url_id: str):
+async def get_url_details(url_id: str):
     """Get detailed information about a specific URL including evaluation results"""
+    # Path parameters arrive percent-decoded already
+    decoded_url = url_id
     try:
-        # Decode the URL-encoded url_id
-        decoded_url = url_id
-        try:
-            decoded_url = urllib.parse.unquote(url_id)
-        except Exception:
-            # If URL decoding fails, use the original
-            pass
-            
         # Load the URL object
-        url_obj = load(URL, decoded_url)
+        url_obj = await load(URL, decoded_url)
         
-        # Get evaluation results for this URL
-        evaluation_runs = scan(EvaluationRun)
+        # Get evaluation results for this URL, only loading the runs that evaluated it (oldest first)
+        run_ids = await find_runs_for_url(decoded_url)
+        evaluation_runs = [run for run in await load_many(EvaluationRun, run_ids) if run is not None]
         url_results = []
         
         for run in evaluation_runs:
@@ -542,16 +600,16 @@ def get_url_details(url_id: str):
         
         if url_results:
             # Calculate average accuracy
-            accuracies = [1 - result.abs_levenshtein_distance_norm for result in url_results]
+            accuracies = [1 - result.levenshtein_distance_norm for result in url_results]
             average_accuracy = sum(accuracies) / len(accuracies)
             
             # Get latest result (most recent evaluation run)
-            latest_run = max(evaluation_runs, key=lambda run: run.datetime_str)
+            latest_run = evaluation_runs[-1]
             latest_result = next((result for result in latest_run.results if result.url == decoded_url), None)
         
         return {
             "url": decoded_url,
-            "domain": url_obj.prefix or "",
+            "domain": (url_obj.prefix if url_obj else None) or "",
             "evaluation_results": url_results,
             "latest_result": latest_result,
             "average_accuracy": average_accuracy,
@@ -567,24 +625,18 @@ def get_url_details(url_id: str):
 
 
 @api.delete("/urls/{url_id:path}")
-def delete_url(url_id: str):
+async def delete_url(url_id: str):
     """Delete a specific URL by its URL"""
+    # Path parameters arrive percent-decoded already
+    decoded_url = url_id
     try:
-        # Decode the URL-encoded url_id
-        decoded_url = url_id
-        try:
-            decoded_url = urllib.parse.unquote(url_id)
-        except Exception:
-            # If URL decoding fails, use the original
-            pass
-            
         # Check if URL exists
-        url_obj = load(URL, decoded_url)
+        url_obj = await load(URL, decoded_url)
         if url_obj is None:
             raise HTTPException(status_code=404, detail=f"URL '{decoded_url}' not found")
         
         # Delete the URL
-        if not delete(URL, decoded_url):
+        if not await delete(URL, decoded_url):
             raise HTTPException(status_code=500, detail="Failed to delete URL")
         
         return {
@@ -600,21 +652,20 @@ def delete_url(url_id: str):
 
 app.include_router(api)
 
-# Catch-all route for frontend SPA routing (must be after API router)
-@app.get("/{full_path:path}")
-def serve_frontend(full_path: str):
-    # Skip API routes - let them be handled by the API router
-    if full_path.startswith("api/"):
-        raise HTTPException(status_code=404, detail="API route not found")
-    
-    # Skip assets - let them be handled by the static files mount
-    if full_path.startswith("assets/"):
-        raise HTTPException(status_code=404, detail="Asset not found")
-    
-    # For all other routes, serve the frontend index.html
-    if INDEX_FILE.exists():
-        return FileResponse(INDEX_FILE)
-    return JSONResponse({"detail": "Frontend not built. Run: cd frontend && npm run build"}, status_code=503)
+if SERVE_STATIC:
+    # Catch-all route for frontend SPA routing (must be after API router)
+    @app.get("/{full_path:path}")
+    def serve_frontend(full_path: str, request: Request):
+        # Skip API routes - let them be handled by the API router
+        if full_path.startswith("api/"):
+            raise HTTPException(status_code=404, detail="API route not found")
+        
+        # Skip assets - let them be handled by the static files mount
+        if full_path.startswith("assets/"):
+            raise HTTPException(status_code=404, detail="Asset not found")
+        
+        # For all other routes, serve the frontend index.html
+        return _serve_index_file(request)
 
 
 class ErrorResponse(BaseModel):
@@ -627,25 +678,25 @@ class ErrorResponse(BaseModel):
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc: HTTPException):
     """Global HTTP exception handler"""
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content=ErrorResponse(
             error=exc.detail,
             timestamp=datetime.now(timezone.utc).isoformat()
-        ).model_dump()
+        ).model_dump(mode="json")
     )
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc: Exception):
     """Global exception handler for unexpected errors"""
     logger.error(f"Unexpected error: {str(exc)}", exc_info=True)
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content=ErrorResponse(
             error="Internal server error",
             detail="An unexpected error occurred",
             timestamp=datetime.now(timezone.utc).isoformat()
-        ).model_dump()
+        ).model_dump(mode="json")
     )
 
 # Main function to run the server
@@ -653,11 +704,16 @@ if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     host = os.getenv("HOST", "0.0.0.0")
     debug = os.getenv("DEBUG", "false").lower() == "true"
+    # One process per worker; the usual (2 x cores) + 1, or a single reloading process in debug mode
+    workers = int(os.getenv("WORKERS", 1 if debug else (os.cpu_count() or 1) * 2 + 1))
     
     uvicorn.run(
         "api:app",
         host=host,
         port=port,
-        reload=debug,
+        workers=workers,
+        reload=debug and workers == 1,
+        loop="uvloop",
+        http="httptools",
         log_level="info"
     )
@@ -1,28 +1,89 @@
-from typing import Union
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Union
 from bs4 import BeautifulSoup
 from bs4.element import NavigableString
+import lxml.html
+from lxml.cssselect import CSSSelector
+from lxml.html import HtmlElement
 
 
-def clean_html(html: Union[str, BeautifulSoup]) -> Union[str, BeautifulSoup]:
-    inp_was_soup = False
-    if isinstance(html, BeautifulSoup):
-        soup = html
-        inp_was_soup = True
-    else:
-        soup = BeautifulSoup(html, "lxml")
-    # remove non-content tags
-    for tag in soup.select("style,svg,canvas,template,head,meta,noscript"):
-        tag.decompose()
+# String input is cleaned with lxml; set CLEAN_HTML_BACKEND=bs4 to fall back to BeautifulSoup
+USE_BS4 = os.getenv("CLEAN_HTML_BACKEND", "lxml").lower() == "bs4"
+
+# non-content tags and hidden elements, removed in a single pass
+_DROP = (
+    "style,svg,canvas,template,head,meta,noscript,"
+    "[hidden],[aria-hidden='true'],[style*='display:none'],[style*='visibility:hidden']"
+)
+# compiled to XPath once instead of on every call
+_DROP_SELECTOR = CSSSelector(_DROP)
+# markup that cleaning would touch; "hidden" also covers aria-hidden and visibility:hidden
+_CLEAN_TOKENS = ("<style", "<svg", "<canvas", "<template", "<head", "<meta", "<noscript", "<br", "hidden", "display:none")
 
-    # remove hidden elements
-    for tag in soup.select("[hidden], [aria-hidden='true'], [style*='display:none'], [style*='visibility:hidden']"):
+
+def _clean_soup(soup: BeautifulSoup) -> BeautifulSoup:
+    # remove non-content tags and hidden elements
+    for tag in soup.select(_DROP):
         tag.decompose()
-    
+
     # turn <br> into newlines
     for br in soup.find_all("br"):
         br.replace_with(NavigableString("\n"))
+    return soup
+
+
+def _clean_tree(tree: HtmlElement) -> HtmlElement:
+    # remove non-content tags and hidden elements
+    for el in _DROP_SELECTOR(tree):
+        if el.getparent() is not None:
+            el.drop_tree()
+
+    # turn <br> into newlines (drop_tree keeps the tail text)
+    for br in list(tree.iter("br")):
+        br.tail = "\n" + (br.tail or "")
+        br.drop_tree()
+    return tree
+
+
+def clean_html(html: Union[str, BeautifulSoup, HtmlElement]) -> Union[str, BeautifulSoup, HtmlElement]:
+    if isinstance(html, BeautifulSoup):
+        return _clean_soup(html)
+    if isinstance(html, HtmlElement):
+        return _clean_tree(html)
+    # nothing to remove: skip building a DOM and return the input as-is
+    lowered = html.lower()
+    if not any(token in lowered for token in _CLEAN_TOKENS):
+        return html
+    if USE_BS4:
+        return _clean_soup(BeautifulSoup(html, "lxml")).decode()
+    if not html.strip():
+        return html
+    tree = _clean_tree(lxml.html.document_fromstring(html))
+    return lxml.html.tostring(tree, encoding="unicode")
+
+
+# Worker processes for clean_html_async, created on first use so processes that never need them don't pay for them
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _process_pool
+
+
+def shutdown_process_pool() -> None:
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
+        _process_pool = None
+
 
-    if inp_was_soup:
-        return soup
-    else:
-        return soup.decode()
+async def clean_html_async(html: str) -> str:
+    """Run clean_html in a worker process so a large document doesn't block the event loop.
+    Takes and returns plain strings, which are cheap to pickle across processes."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), clean_html, html)
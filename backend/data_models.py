@@ -1,12 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from pathlib import Path
 import os
 import yaml
-from typing import Optional
-from pydantic import BaseModel, Field, field_validator, model_validator
-from Levenshtein import distance
+import numpy as np
+from typing import Annotated, AsyncIterator, Optional
+from pydantic import BaseModel, Field, PlainSerializer, WithJsonSchema, computed_field, field_validator
+from rapidfuzz.distance import Levenshtein
 
 from paths import CONFIGS_PATH, EVALS_PATH
 
+# libyaml bindings when PyYAML was built with them, the pure-Python implementation otherwise
+try:
+    from yaml import CSafeDumper as YamlDumper, CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeDumper as YamlDumper, SafeLoader as YamlLoader
+
+EVALS_LOAD_WORKERS = 16
+
 
 class EvaluationResult(BaseModel):
     levenshtein_distance_norm: float = Field(alias="abs_levenshtein_distance_norm")
@@ -25,7 +36,6 @@ class EvaluationResult(BaseModel):
 class EvaluationRun(BaseModel):
     results: list[EvaluationResult]
     datetime_str: str
-    id: str = Field(default="", frozen=True)
 
     def get_evaluation_results(self, domain: Optional[str] = None, config_name: Optional[str] = None) -> 'EvaluationResults':
         results = self.results
@@ -33,19 +43,17 @@ class EvaluationRun(BaseModel):
             results = [result for result in results if result.domain == domain]
         if config_name is not None:
             results = [result for result in results if result.config_name == config_name]
-        return EvaluationResults(
-            levenshtein_distance_norm=sum([result.levenshtein_distance_norm for result in results]) / len(results),
-            exact_match=sum([result.exact_match for result in results]) / len(results),
-            missing_content=sum([result.missing_content for result in results]) / len(results),
-            extra_content=sum([result.extra_content for result in results]) / len(results),
-            domain=domain,
-            config_name=config_name
-        )
+        return EvaluationResults.from_results(results, domain=domain, config_name=config_name)
     
-    @model_validator(mode="after")
-    def _derive_id(self):
-        object.__setattr__(self, "id", self.datetime_str)
-        return self
+    @computed_field
+    @property
+    def id(self) -> str:
+        return self.datetime_str
+
+
+# One row per EvaluationResult when averaging them; the averages are column means
+_EVALUATION_ROW_DTYPE = np.dtype([("levenshtein_distance_norm", "f8"), ("exact_match", "?"),
+                                  ("missing_content", "?"), ("extra_content", "?")])
 
 
 class EvaluationResults(BaseModel):
@@ -56,6 +64,24 @@ class EvaluationResults(BaseModel):
     domain: Optional[str] = None
     config_name: Optional[str] = None
 
+    @classmethod
+    def from_results(cls, results: list[EvaluationResult], domain: Optional[str] = None,
+                     config_name: Optional[str] = None) -> "EvaluationResults":
+        """Average a list of results, in a single pass over them"""
+        if not results:
+            raise ValueError("No evaluation results to aggregate")
+        rows = np.fromiter(((result.levenshtein_distance_norm, result.exact_match,
+                             result.missing_content, result.extra_content) for result in results),
+                           dtype=_EVALUATION_ROW_DTYPE, count=len(results))
+        return cls(
+            levenshtein_distance_norm=rows["levenshtein_distance_norm"].mean(),
+            exact_match=rows["exact_match"].mean(),
+            missing_content=rows["missing_content"].mean(),
+            extra_content=rows["extra_content"].mean(),
+            domain=domain,
+            config_name=config_name
+        )
+
 
 class ValidationLabel(BaseModel):
     content: str
@@ -66,21 +92,20 @@ class URL(BaseModel):
     prefix: Optional[str] = None
     raw_content: Optional[str] = None
     parsed_content: Optional[str] = None
-    id: str = Field(default="", frozen=True)
 
-    def save(self):
+    async def save(self):
         from db import save
-        save(self)
+        await save(self)
 
     @classmethod
-    def load(cls, url: str) -> Optional["URL"]:
+    async def load(cls, url: str) -> Optional["URL"]:
         from db import load
-        return load(cls, url)
+        return await load(cls, url)
 
-    @model_validator(mode="after")
-    def _derive_id(self):
-        object.__setattr__(self, "id", self.url)
-        return self
+    @computed_field
+    @property
+    def id(self) -> str:
+        return self.url
 
 
 class URLQueueItem(BaseModel):
@@ -101,9 +126,11 @@ class SampleURL(BaseModel):
         else:
             file_name = EVALS_PATH / domain / "input" / (url_path + ".yaml")
         file_name.parent.mkdir(parents=True, exist_ok=True)
-        content = yaml.safe_dump(self.model_dump(), sort_keys=False)
+        content = yaml.dump(self.model_dump(), Dumper=YamlDumper, sort_keys=False)
         with open(file_name, "w") as f:
             f.write(content)
+        # Parsed copy next to the YAML, so later loads can skip YAML parsing altogether
+        file_name.with_suffix(".json").write_bytes(self.__pydantic_serializer__.to_json(self))
         return file_name
 
     @classmethod
@@ -114,8 +141,14 @@ class SampleURL(BaseModel):
             file_name = EVALS_PATH / domain / "validation" / file_name
         else:
             file_name = EVALS_PATH / domain / "input" / file_name
+        json_file_name = file_name.with_suffix(".json")
+        try:
+            if json_file_name.stat().st_mtime_ns >= file_name.stat().st_mtime_ns:
+                return cls.model_validate_json(json_file_name.read_bytes())
+        except FileNotFoundError:
+            pass
         with open(file_name, "r") as f:
-            content = yaml.safe_load(f)
+            content = yaml.load(f, Loader=YamlLoader)
         return cls(**content)
     
     @classmethod
@@ -125,12 +158,28 @@ class SampleURL(BaseModel):
         raw_content = load_raw_html(url)
         return cls(url=url, raw_content=raw_content)
 
-    def evaluate(self, parsed_content: str, config_name: str, domain: str) -> EvaluationResult:
-        levenshtein_distance = distance(self.label.content, parsed_content)
-        levenshtein_distance_norm = levenshtein_distance / len(self.label.content)
-        exact_match = self.label.content == parsed_content
-        missing_content = self.label.content not in parsed_content
-        extra_content = parsed_content not in self.label.content
+    @classmethod
+    async def from_url_async(cls, url: str) -> "SampleURL":
+        from load_html import load_raw_html_async
+
+        raw_content = await load_raw_html_async(url)
+        return cls(url=url, raw_content=raw_content)
+
+    def evaluate(self, parsed_content: str, config_name: str, domain: str,
+                 levenshtein_distance_norm: Optional[float] = None) -> EvaluationResult:
+        """Score `parsed_content` against the label. Pass `levenshtein_distance_norm` if it was already computed in a batch."""
+        expected_content = self.label.content
+        if levenshtein_distance_norm is None:
+            # Distance over the longer of the two strings, so the score stays in [0, 1] (and is 0 for two empty strings)
+            levenshtein_distance_norm = Levenshtein.normalized_distance(expected_content, parsed_content)
+        exact_match = levenshtein_distance_norm == 0
+        if exact_match:
+            missing_content = extra_content = False
+        else:
+            # A string can only contain one at least as long, so the length check skips most substring searches
+            expected_length, parsed_length = len(expected_content), len(parsed_content)
+            missing_content = parsed_length < expected_length or expected_content not in parsed_content
+            extra_content = expected_length < parsed_length or parsed_content not in expected_content
         return EvaluationResult(levenshtein_distance_norm=levenshtein_distance_norm,
                                 exact_match=exact_match,
                                 missing_content=missing_content,
@@ -138,44 +187,69 @@ class SampleURL(BaseModel):
                                 config_name=config_name,
                                 domain=domain,
                                 url=self.url,
-                                expected_content=self.label.content,
+                                expected_content=expected_content,
                                 parsed_content=parsed_content)
 
 
+# Selector sets: union is a single hash-table operation, while dumps and the JSON schema handed to the
+# LLM stay plain (sorted) string lists
+SelectorSet = Annotated[
+    frozenset[str],
+    PlainSerializer(sorted, return_type=list[str]),
+    WithJsonSchema({"type": "array", "items": {"type": "string"}}),
+]
+
+
 class ParserParameters(BaseModel):
-    root: list[str]
-    keep: list[str]
-    drop: list[str]
-    unwrap: list[str]
+    root: SelectorSet
+    keep: SelectorSet
+    drop: SelectorSet
+    unwrap: SelectorSet
 
     @field_validator("root")
     @classmethod
     def _normalize_root(cls, v):
         if isinstance(v, str):
-            return [v]
+            return frozenset((v,))
         return v
     
     def __add__(self, other: "ParserParameters") -> "ParserParameters":
-        return ParserParameters(root=list(set(self.root) | set(other.root)),
-                                keep=list(set(self.keep) | set(other.keep)),
-                                drop=list(set(self.drop) | set(other.drop)),
-                                unwrap=list(set(self.unwrap) | set(other.unwrap)))
+        return ParserParameters(root=self.root | other.root,
+                                keep=self.keep | other.keep,
+                                drop=self.drop | other.drop,
+                                unwrap=self.unwrap | other.unwrap)
+
+
+class ParserParametersPatch(BaseModel):
+    """Selectors to add to and remove from each list of a ParserParameters"""
+    add_root: SelectorSet
+    remove_root: SelectorSet
+    add_keep: SelectorSet
+    remove_keep: SelectorSet
+    add_drop: SelectorSet
+    remove_drop: SelectorSet
+    add_unwrap: SelectorSet
+    remove_unwrap: SelectorSet
+
+    def apply(self, parameters: ParserParameters) -> ParserParameters:
+        return ParserParameters(root=(parameters.root - self.remove_root) | self.add_root,
+                                keep=(parameters.keep - self.remove_keep) | self.add_keep,
+                                drop=(parameters.drop - self.remove_drop) | self.add_drop,
+                                unwrap=(parameters.unwrap - self.remove_unwrap) | self.add_unwrap)
 
 
 class ParserConfig(BaseModel):
     parameters: ParserParameters
     prefix_name: str
-    id: str = Field(default="", frozen=True)
 
-    @model_validator(mode="after")
-    def _derive_id(self):
-        object.__setattr__(self, "id", self.prefix_name)
-        return self
+    @computed_field
+    @property
+    def id(self) -> str:
+        return self.prefix_name
 
     def __add__(self, other: "ParserConfig") -> "ParserConfig":
         return ParserConfig(parameters=self.parameters + other.parameters,
-                            prefix_name=self.prefix_name,
-                            id=self.id)
+                            prefix_name=self.prefix_name)
 
 
 class URLPrefix(BaseModel):
@@ -184,22 +258,26 @@ class URLPrefix(BaseModel):
     validation_urls: Optional[list[SampleURL]] = []
     parser_config: Optional[ParserConfig] = None
     processing_status: Optional[str] = None  # None = not processed, "in_progress", "completed", "failed"
-    id: str = Field(default="", frozen=True)
 
-    @model_validator(mode="after")
-    def _derive_id(self):
-        object.__setattr__(self, "id", self.prefix)
-        return self
+    @computed_field
+    @property
+    def id(self) -> str:
+        return self.prefix
 
     @classmethod
     def from_evals(cls, domain: str) -> "URLPrefix":
         prefix = domain
-        sample_urls = []
-        validation_urls = []
-        for file_name in os.listdir(EVALS_PATH / domain / "input"):
-            sample_urls.append(SampleURL.load(domain, file_name, validation=False))
-        for file_name in os.listdir(EVALS_PATH / domain / "validation"):
-            validation_urls.append(SampleURL.load(domain, file_name, validation=True))
+
+        def yaml_files(subdir: str) -> list[str]:
+            with os.scandir(EVALS_PATH / domain / subdir) as entries:
+                return [entry.name for entry in entries if entry.name.endswith(".yaml") and entry.is_file()]
+
+        # The files are independent, so the reads and parses overlap in a thread pool
+        with ThreadPoolExecutor(max_workers=EVALS_LOAD_WORKERS) as executor:
+            sample_urls = list(executor.map(lambda file_name: SampleURL.load(domain, file_name, validation=False),
+                                            yaml_files("input")))
+            validation_urls = list(executor.map(lambda file_name: SampleURL.load(domain, file_name, validation=True),
+                                                yaml_files("validation")))
         return cls(prefix=prefix,
                    sample_urls=sample_urls,
                    validation_urls=validation_urls if validation_urls else None)
@@ -212,28 +290,14 @@ class URLPrefixWithUrls(BaseModel):
     url_count: int = Field(description="Total number of URLs")
     
     @classmethod
-    def from_url_prefix(cls, url_prefix: URLPrefix) -> "URLPrefixWithUrls":
-        """Create URLPrefixWithUrls from a URLPrefix object"""
-        # Extract all URLs from sample_urls and validation_urls
-        all_urls = []
-        
-        # Add URLs from sample_urls
-        for sample_url in url_prefix.sample_urls:
-            all_urls.append(sample_url.url)
-        
-        # Add URLs from validation_urls if they exist
-        if url_prefix.validation_urls:
-            for validation_url in url_prefix.validation_urls:
-                all_urls.append(validation_url.url)
-        
-        # Add URLs from the database that have this prefix
-        from db import find_urls_with_prefix
-        db_urls = find_urls_with_prefix(url_prefix.prefix)
-        for url_obj in db_urls:
-            all_urls.append(url_obj.url)
-        
-        # Remove duplicates and sort
-        unique_urls = sorted(list(set(all_urls)))
+    def _from_urls(cls, url_prefix: URLPrefix, db_urls: list[str]) -> "URLPrefixWithUrls":
+        """Build the wrapper from a URLPrefix and the URLs stored in the database under it"""
+        # Sample, validation and database URLs, deduplicated and sorted in one pass
+        unique_urls = sorted(set(chain(
+            (sample_url.url for sample_url in url_prefix.sample_urls),
+            (validation_url.url for validation_url in url_prefix.validation_urls or []),
+            db_urls,
+        )))
         
         return cls(
             url_prefix=url_prefix,
@@ -241,6 +305,22 @@ class URLPrefixWithUrls(BaseModel):
             url_count=len(unique_urls)
         )
 
+    @classmethod
+    async def from_url_prefix(cls, url_prefix: URLPrefix) -> "URLPrefixWithUrls":
+        """Create URLPrefixWithUrls from a URLPrefix object"""
+        from db import find_urls_with_prefix
+        db_urls = await find_urls_with_prefix(url_prefix.prefix)
+        return cls._from_urls(url_prefix, [url_obj.url for url_obj in db_urls])
+
+    @classmethod
+    async def from_url_prefix_batches(cls, url_prefix_batches: AsyncIterator[list[URLPrefix]]) -> AsyncIterator[list["URLPrefixWithUrls"]]:
+        """Create URLPrefixWithUrls for batches of prefixes, looking up the stored URLs one batch at a time"""
+        from db import find_urls_with_prefixes
+        async for url_prefixes in url_prefix_batches:
+            db_urls_by_prefix = await find_urls_with_prefixes([url_prefix.prefix for url_prefix in url_prefixes])
+            yield [cls._from_urls(url_prefix, [url_obj.url for url_obj in db_urls_by_prefix[url_prefix.prefix]])
+                   for url_prefix in url_prefixes]
+
 
 class ParserGeneratorConfig(BaseModel):
     config_name: str
@@ -250,23 +330,15 @@ class ParserGeneratorConfig(BaseModel):
     input_prompt_template: str
     error_prompt: Optional[str] = None
     reflection_prompt: Optional[str] = None
-    id: str = Field(default="", frozen=True)
-
-    @model_validator(mode="after")
-    def _derive_id(self):
-        object.__setattr__(self, "id", self.config_name)
-        return self
 
+    @computed_field
     @property
-    def is_production(self) -> bool:
-        """Dynamically check if this config is the current production config"""
-        from db import get_production_config
-        production_config = get_production_config()
-        return self.config_name == production_config
+    def id(self) -> str:
+        return self.config_name
 
     @classmethod
     def from_config(cls, config_name: str) -> "ParserGeneratorConfig":
         with open(CONFIGS_PATH / f"{config_name}.yaml", "r") as f:
-            config = yaml.load(f, Loader=yaml.SafeLoader)
+            config = yaml.load(f, Loader=YamlLoader)
         config["config_name"] = config_name
         return cls(**config)
@@ -1,13 +1,15 @@
 from __future__ import annotations
-from typing import TypeVar
-from pydantic import BaseModel
-import orjson
-from redis_utils import get_redis
+import time
+from datetime import datetime
+from typing import AsyncIterator, Callable, TypeVar
+from pydantic import BaseModel, TypeAdapter
+from redis.exceptions import WatchError
+from redis_utils import get_async_redis
 
-from data_models import URL, URLPrefix
+from data_models import URL, URLPrefix, EvaluationRun
 
 
-R = get_redis()
+R = get_async_redis()
 
 # --- models ---
 T = TypeVar("T", bound=BaseModel)
@@ -16,90 +18,364 @@ def key(model_or_cls, id_: str) -> str:
     name = model_or_cls.__name__ if isinstance(model_or_cls, type) else model_or_cls.__class__.__name__
     return f"model:{name}:{id_}"
 
-def save(model: BaseModel) -> None:
-    k = key(model, model.id)
-    R.set(k, orjson.dumps(model.model_dump(mode="json")))
+def ids_key(model_or_cls) -> str:
+    """Set of the ids stored for a model class, so counting it is a single SCARD"""
+    name = model_or_cls.__name__ if isinstance(model_or_cls, type) else model_or_cls.__class__.__name__
+    return f"ids:{name}"
+
+# Model classes that are stored through save(); reindex.py rebuilds their id sets
+STORED_MODELS = (URL, URLPrefix, EvaluationRun)
+
+# --- secondary indexes ---
+# Maintained next to the model keys so lookups don't need a full scan.
+# Run reindex.py to build them for data written before an index existed.
+def eval_index_key(url: str) -> str:
+    """Sorted set of ids of the EvaluationRuns that have a result for `url`, scored by run time"""
+    return f"url:eval_index:{url}"
+
+def run_time_score(run: EvaluationRun) -> float:
+    """Sort score for a run: its timestamp, or 0 if datetime_str isn't ISO formatted"""
+    try:
+        return datetime.fromisoformat(run.datetime_str).timestamp()
+    except ValueError:
+        return 0.0
+
+def prefix_index_key(prefix: str) -> str:
+    """Set of ids of the URLs stored under `prefix`"""
+    return f"prefix:url_index:{prefix}"
+
+# Every URL with at least one evaluation result, all at score 0 so ZRANGE returns them sorted
+EVALUATED_URLS_KEY = "evaluated_urls"
+
+INDEXED_MODELS = (EvaluationRun, URL)
+
+# Set once the id sets and indexes have been built for the stored data (by reindex.py or on API startup)
+INDEXES_BUILT_KEY = "indexes_built"
+
+def add_to_indexes(pipe, model: BaseModel) -> None:
+    """Queue the index writes for `model` on a pipeline"""
+    if isinstance(model, EvaluationRun):
+        urls = {result.url for result in model.results}
+        score = run_time_score(model)
+        for url in urls:
+            pipe.zadd(eval_index_key(url), {model.id: score})
+        if urls:
+            pipe.zadd(EVALUATED_URLS_KEY, dict.fromkeys(urls, 0))
+    elif isinstance(model, URL) and model.prefix:
+        pipe.sadd(prefix_index_key(model.prefix), model.id)
+
+def remove_from_indexes(pipe, model: BaseModel) -> None:
+    """Queue the index removals for `model` on a pipeline"""
+    if isinstance(model, EvaluationRun):
+        for url in {result.url for result in model.results}:
+            pipe.zrem(eval_index_key(url), model.id)
+    elif isinstance(model, URL) and model.prefix:
+        pipe.srem(prefix_index_key(model.prefix), model.id)
+
+async def prune_indexes(models) -> None:
+    """Clean up index entries that may have become unused after `models` were deleted"""
+    urls = {result.url for model in models if isinstance(model, EvaluationRun) for result in model.results}
+    if not urls:
+        return
+    urls = list(urls)
+    index_keys = [eval_index_key(url) for url in urls]
+    async with R.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                # WATCH so a concurrent save that adds a result for one of these URLs aborts the removal
+                await pipe.watch(*index_keys)
+                unused = [url for url, k in zip(urls, index_keys) if not await pipe.exists(k)]
+                pipe.multi()
+                if unused:
+                    pipe.zrem(EVALUATED_URLS_KEY, *unused)
+                await pipe.execute()
+                return
+            except WatchError:
+                continue
+
+async def clear_indexes(cls) -> None:
+    """Drop every index entry that belongs to `cls`"""
+    if cls is EvaluationRun:
+        keys = [EVALUATED_URLS_KEY] + await scan_keys(eval_index_key("*"))
+    elif cls is URL:
+        keys = await scan_keys(prefix_index_key("*"))
+    else:
+        return
+    async with R.pipeline(transaction=False) as pipe:
+        for i in range(0, len(keys), DELETE_BATCH_SIZE):
+            pipe.delete(*keys[i:i + DELETE_BATCH_SIZE])
+        await pipe.execute()
+
+def queue_save(pipe, model: BaseModel) -> None:
+    """Queue the writes that store `model` and its index entries on a pipeline"""
+    pipe.set(key(model, model.id), model.__pydantic_serializer__.to_json(model))
+    pipe.sadd(ids_key(model), model.id)
+    add_to_indexes(pipe, model)
+
+async def save(model: BaseModel) -> None:
+    # MULTI/EXEC so the model and its index entries land together
+    async with R.pipeline(transaction=True) as pipe:
+        queue_save(pipe, model)
+        await pipe.execute()
+
+async def update_if(cls: type[T], id_: str, update: Callable[[T | None], T | None]) -> T | None:
+    """Compare-and-set: pass the stored instance (None if missing) to `update` and save what it returns.
+
+    If `update` returns None nothing is written. The key is WATCHed, so a concurrent write between
+    the read and the save reruns `update` on the new value. Returns the saved instance or None.
+    """
+    k = key(cls, id_)
+    async with R.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                await pipe.watch(k)
+                raw = await pipe.get(k)
+                model = update(cls.model_validate_json(raw) if raw else None)
+                if model is None:
+                    await pipe.unwatch()
+                    return None
+                pipe.multi()
+                queue_save(pipe, model)
+                await pipe.execute()
+                break
+            except WatchError:
+                continue
+    return model
+
+async def load(cls, id_: str):
+    raw = await R.get(key(cls, id_))
+    return cls.model_validate_json(raw) if raw else None
+
+async def load_many(cls, ids) -> list:
+    """Load several instances in one MGET round trip. Missing ids come back as None, in order."""
+    ids = list(ids)
+    if not ids:
+        return []
+    raws = await R.mget([key(cls, id_) for id_ in ids])
+    return [cls.model_validate_json(raw) if raw else None for raw in raws]
+
+SCAN_BATCH_SIZE = 500
+
+async def scan_keys(pattern: str, batch_size: int = SCAN_BATCH_SIZE) -> list[bytes]:
+    """Keys matching `pattern`, walked incrementally with SCAN so Redis is never blocked like with KEYS"""
+    # SCAN may return a key more than once
+    return list(dict.fromkeys([k async for k in R.scan_iter(match=pattern, count=batch_size)]))
 
-def load(cls, id_: str):
-    raw = R.get(key(cls, id_))
-    return cls(**orjson.loads(raw)) if raw else None
+async def scan(cls) -> list[BaseModel]:
+    return [model async for batch in scan_batches(cls) for model in batch]
 
-def scan(cls) -> list[BaseModel]:
-    keys = R.keys(key(cls, "*"))
-    return [cls(**orjson.loads(R.get(key))) for key in keys]
+_list_adapters: dict[type, TypeAdapter] = {}
 
-def count(cls) -> int:
-    return len(R.keys(key(cls, "*")))
+def validate_many(cls, raws: list[bytes | None]) -> list[BaseModel]:
+    """Validate stored JSON documents in a single pydantic-core call, skipping missing ones"""
+    adapter = _list_adapters.get(cls)
+    if adapter is None:
+        adapter = _list_adapters[cls] = TypeAdapter(list[cls])
+    # The stored values are JSON objects already, so joining them gives a valid JSON array
+    return adapter.validate_json(b"[" + b",".join(raw for raw in raws if raw) + b"]")
 
-def delete_all(cls) -> int:
+async def scan_batches(cls, batch_size: int = SCAN_BATCH_SIZE) -> AsyncIterator[list[BaseModel]]:
+    """Yield the stored instances of `cls` a batch at a time, walking only the class's id set"""
+    seen = set()
+    batch = []
+    async for id_ in R.sscan_iter(ids_key(cls), count=batch_size):
+        # SSCAN may return a member more than once
+        if id_ in seen:
+            continue
+        seen.add(id_)
+        batch.append(key(cls, id_.decode("utf-8")))
+        if len(batch) >= batch_size:
+            yield validate_many(cls, await R.mget(batch))
+            batch = []
+    if batch:
+        yield validate_many(cls, await R.mget(batch))
+
+async def count(cls) -> int:
+    return await R.scard(ids_key(cls))
+
+async def count_many(classes) -> dict[type, int]:
+    """Counts for several model classes in one pipelined round trip"""
+    async with R.pipeline(transaction=False) as pipe:
+        for cls in classes:
+            pipe.scard(ids_key(cls))
+        return dict(zip(classes, await pipe.execute()))
+
+async def delete_all(cls) -> int:
     """Delete all instances of a model class from Redis. Returns the number of deleted items."""
-    keys = R.keys(key(cls, "*"))
-    if keys:
-        R.delete(*keys)
-    return len(keys)
+    keys = [key(cls, id_.decode("utf-8")) for id_ in await R.smembers(ids_key(cls))]
+    async with R.pipeline(transaction=False) as pipe:
+        pipe.delete(ids_key(cls))
+        for i in range(0, len(keys), DELETE_BATCH_SIZE):
+            pipe.delete(*keys[i:i + DELETE_BATCH_SIZE])
+        results = await pipe.execute()
+    await clear_indexes(cls)
+    return sum(results[1:])
 
 
-def delete(cls, id_: str) -> bool:
+async def delete(cls, id_: str) -> bool:
     """Delete a specific model instance by its ID. Returns True if deleted, False if not found."""
     k = key(cls, id_)
-    if R.exists(k):
-        R.delete(k)
+    if issubclass(cls, INDEXED_MODELS):
+        # The stored model is needed to know which index entries to remove
+        raw = await R.get(k)
+        if raw is None:
+            return False
+        model = cls.model_validate_json(raw)
+        async with R.pipeline(transaction=True) as pipe:
+            pipe.delete(k)
+            pipe.srem(ids_key(cls), id_)
+            remove_from_indexes(pipe, model)
+            await pipe.execute()
+        await prune_indexes([model])
         return True
-    return False
+    async with R.pipeline(transaction=True) as pipe:
+        pipe.delete(k)
+        pipe.srem(ids_key(cls), id_)
+        deleted, _ = await pipe.execute()
+    return bool(deleted)
+
+
+DELETE_BATCH_SIZE = 1000
+
+
+async def delete_many(cls, ids) -> int:
+    """Delete several model instances in one round trip. Returns the number of instances that existed."""
+    ids = list(dict.fromkeys(ids))
+    keys = [key(cls, id_) for id_ in ids]
+    if not keys:
+        return 0
+    models = []
+    if issubclass(cls, INDEXED_MODELS):
+        models = validate_many(cls, await R.mget(keys))
+    async with R.pipeline(transaction=True) as pipe:
+        for model in models:
+            remove_from_indexes(pipe, model)
+        # Keep each command to a bounded number of arguments; the DELs go last so their counts can be summed
+        for i in range(0, len(ids), DELETE_BATCH_SIZE):
+            pipe.srem(ids_key(cls), *ids[i:i + DELETE_BATCH_SIZE])
+        for i in range(0, len(keys), DELETE_BATCH_SIZE):
+            pipe.delete(*keys[i:i + DELETE_BATCH_SIZE])
+        results = await pipe.execute()
+    await prune_indexes(models)
+    return sum(results[-((len(keys) - 1) // DELETE_BATCH_SIZE + 1):])
 
 
 # Production config management
+# Production config and system state are read on most requests and every worker iteration but rarely
+# written, so reads go through a short in-process cache. Writes made through this module update it
+# directly; writes from other processes become visible once the TTL runs out.
+SETTINGS_CACHE_TTL_SECONDS = 1.0
+_settings_cache: dict[str, tuple[float, str | None]] = {}
+
+async def _get_setting(redis_key: str) -> str | None:
+    cached = _settings_cache.get(redis_key)
+    now = time.monotonic()
+    if cached is not None and now - cached[0] < SETTINGS_CACHE_TTL_SECONDS:
+        return cached[1]
+    raw = await R.get(redis_key)
+    value = raw.decode('utf-8') if raw else None
+    _settings_cache[redis_key] = (now, value)
+    return value
+
+async def _set_setting(redis_key: str, value: str) -> None:
+    await R.set(redis_key, value)
+    _settings_cache[redis_key] = (time.monotonic(), value)
+
 PRODUCTION_CONFIG_KEY = "production_config"
 
-def get_production_config() -> str | None:
+async def get_production_config() -> str | None:
     """Get the current production config name"""
-    return R.get(PRODUCTION_CONFIG_KEY).decode('utf-8') if R.get(PRODUCTION_CONFIG_KEY) else None
+    return await _get_setting(PRODUCTION_CONFIG_KEY)
 
-def set_production_config(config_name: str) -> None:
+async def set_production_config(config_name: str) -> None:
     """Set the current production config name"""
-    R.set(PRODUCTION_CONFIG_KEY, config_name)
+    await _set_setting(PRODUCTION_CONFIG_KEY, config_name)
 
 # System state management
 SYSTEM_STATE_KEY = "system_state"
 
-def get_system_state() -> str:
+async def get_system_state() -> str:
     """Get the current system state (PAUSE or RUNNING)"""
-    state = R.get(SYSTEM_STATE_KEY)
-    return state.decode('utf-8') if state else "RUNNING"  # Default to RUNNING
+    return await _get_setting(SYSTEM_STATE_KEY) or "RUNNING"  # Default to RUNNING
 
-def set_system_state(state: str) -> None:
+async def set_system_state(state: str) -> None:
     """Set the system state to PAUSE or RUNNING"""
     if state not in ["PAUSE", "RUNNING"]:
         raise ValueError("State must be either 'PAUSE' or 'RUNNING'")
-    R.set(SYSTEM_STATE_KEY, state)
+    async with R.pipeline(transaction=True) as pipe:
+        pipe.set(SYSTEM_STATE_KEY, state)
+        # Paused workers wait on this channel, so a resume reaches them right away instead of at their next poll
+        pipe.publish(SYSTEM_STATE_CHANNEL, state)
+        await pipe.execute()
+    _settings_cache[SYSTEM_STATE_KEY] = (time.monotonic(), state)
 
-def is_system_running() -> bool:
+async def is_system_running() -> bool:
     """Check if the system is in RUNNING state"""
-    return get_system_state() == "RUNNING"
+    return await get_system_state() == "RUNNING"
+
+SYSTEM_STATE_CHANNEL = "system_state_changes"
 
-def find_prefix_for_url(url: str) -> URLPrefix | None:
+async def wait_for_system_running(timeout: float) -> bool:
+    """Wait up to `timeout` seconds for the system to be in RUNNING state. Returns whether it is."""
+    async with R.pubsub() as pubsub:
+        # Subscribe before checking, so a resume between the check and the wait isn't missed
+        await pubsub.subscribe(SYSTEM_STATE_CHANNEL)
+        if await is_system_running():
+            return True
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            if message is not None and message["data"] == b"RUNNING":
+                _settings_cache[SYSTEM_STATE_KEY] = (time.monotonic(), "RUNNING")
+                return True
+    return await is_system_running()
+
+async def find_prefix_for_url(url: str) -> URLPrefix | None:
     """Find the prefix for a given URL by iteratively checking higher-level prefixes"""
     # Start with the full URL and progressively shorten it
     # This allows us to find the most specific prefix match
     url_parts = url.split('/')
     
-    # Try progressively shorter prefixes
-    for i in range(len(url_parts), 0, -1):
-        potential_prefix = '/'.join(url_parts[:i])
-        prefix_obj = load(URLPrefix, potential_prefix)
+    # Fetch every candidate prefix, longest first, in one MGET and take the first that exists
+    potential_prefixes = ['/'.join(url_parts[:i]) for i in range(len(url_parts), 0, -1)]
+    for prefix_obj in await load_many(URLPrefix, potential_prefixes):
         if prefix_obj:
             return prefix_obj
     
     return None
 
 
-def find_urls_with_prefix(prefix: str) -> list[URL]:
+async def find_urls_with_prefix(prefix: str) -> list[URL]:
     """Find all URL objects in the database that have the given prefix"""
-    all_urls = scan(URL)
-    matching_urls = []
-    
-    for url_obj in all_urls:
-        if url_obj.prefix == prefix:
-            matching_urls.append(url_obj)
-    
-    return matching_urls
+    return (await find_urls_with_prefixes([prefix]))[prefix]
+
+
+async def find_urls_with_prefixes(prefixes: list[str]) -> dict[str, list[URL]]:
+    """Find the URL objects stored under each of several prefixes, in two round trips"""
+    async with R.pipeline(transaction=False) as pipe:
+        for prefix in prefixes:
+            pipe.smembers(prefix_index_key(prefix))
+        id_sets = await pipe.execute()
+    ids = list({id_.decode("utf-8") for id_set in id_sets for id_ in id_set})
+    urls_by_prefix: dict[str, list[URL]] = {prefix: [] for prefix in prefixes}
+    for url_obj in await load_many(URL, ids):
+        # A URL re-saved under another prefix stays in the old set, so group by the stored prefix
+        if url_obj is not None and url_obj.prefix in urls_by_prefix:
+            urls_by_prefix[url_obj.prefix].append(url_obj)
+    return urls_by_prefix
+
+
+async def count_urls_with_prefix(prefix: str) -> int:
+    """Number of URLs stored under `prefix`, with a single SCARD on the prefix index.
+    Unlike find_urls_with_prefix this doesn't check each URL's stored prefix, so a URL that was
+    re-saved under another prefix is still counted here."""
+    return await R.scard(prefix_index_key(prefix))
+
+
+async def list_evaluated_urls() -> list[str]:
+    """All URLs that have at least one evaluation result, sorted"""
+    return [url.decode("utf-8") for url in await R.zrange(EVALUATED_URLS_KEY, 0, -1)]
+
+async def find_runs_for_url(url: str) -> list[str]:
+    """Ids of the EvaluationRuns that have a result for the given URL, oldest first"""
+    return [run_id.decode("utf-8") for run_id in await R.zrange(eval_index_key(url), 0, -1)]
@@ -1,16 +1,36 @@
-import gzip
+import asyncio
+import functools
+import logging
+import zlib
 import datetime as dt
 import re
 import urllib.parse as up
 import xml.etree.ElementTree as ET
-from typing import Iterator, List, Optional, Tuple
+from typing import List, Optional, Tuple
 
-import requests
+import httpx
 
 UA = {"User-Agent": "URLDiscover/1.0 (+personal use)"}
 
+# One pooled client per discovery run; child sitemaps are fetched this many at a time
+CLIENT_OPTIONS = dict(
+    headers=UA,
+    http2=True,
+    follow_redirects=True,
+    timeout=httpx.Timeout(15.0, connect=5.0),
+    limits=httpx.Limits(max_connections=32),
+)
+SITEMAP_CONCURRENCY = 8
+# Download and decompression window for sitemaps, which can be hundreds of MB once inflated
+READ_CHUNK_SIZE = 64 * 1024
+
+# Diagnostics go through logging (lazily formatted) rather than print, so large bodies are never written out by default
+logger = logging.getLogger(__name__)
+
+_SCHEME_RE = re.compile(r"^https?://")
+
 def _ensure_scheme(url: str) -> str:
-    if not re.match(r"^https?://", url):
+    if not _SCHEME_RE.match(url):
         return "https://" + url
     return url
 
@@ -18,47 +38,45 @@ def _domain_root(url: str) -> str:
     u = up.urlparse(url)
     return f"{u.scheme}://{u.netloc}"
 
-def _get_text(resp: requests.Response) -> bytes:
-    content = resp.content
-    if resp.headers.get("Content-Type", "").startswith("application/x-gzip") or resp.url.endswith(".gz"):
-        return gzip.decompress(content)
-    return content
-
-def _fetch(url: str, timeout=(5, 15)) -> requests.Response:
-    resp = requests.get(url, headers=UA, timeout=timeout)
-    print(resp)
-    print(resp.text)
+async def _fetch(client: httpx.AsyncClient, url: str) -> httpx.Response:
+    resp = await client.get(url)
     resp.raise_for_status()
     return resp
 
-def _discover_sitemaps(base: str) -> List[str]:
-    sitemaps = set()
-    # robots.txt
+async def _probe(client: httpx.AsyncClient, url: str) -> Optional[str]:
+    """Resolved URL if `url` exists; only the status is needed, so the body is never downloaded"""
     try:
-        r = _fetch(up.urljoin(base, "/robots.txt"))
-        for line in r.text.splitlines():
-            if line.lower().startswith("sitemap:"):
-                sm = line.split(":", 1)[1].strip()
-                if sm:
-                    sitemaps.add(sm)
+        async with client.stream("GET", url) as resp:
+            return str(resp.url) if resp.is_success else None
     except Exception:
-        pass
+        return None
 
-    # common fallbacks
-    for cand in ["/sitemap.xml", "/sitemap_index.xml"]:
+async def _discover_sitemaps(client: httpx.AsyncClient, base: str) -> List[str]:
+    async def from_robots() -> List[str]:
         try:
-            url = up.urljoin(base, cand)
-            resp = _fetch(url)
-            if resp.ok:
-                sitemaps.add(resp.url)  # resolved URL
+            r = await _fetch(client, up.urljoin(base, "/robots.txt"))
         except Exception:
-            pass
+            return []
+        found = []
+        for line in r.text.splitlines():
+            if line.lower().startswith("sitemap:"):
+                sm = line.split(":", 1)[1].strip()
+                if sm:
+                    found.append(sm)
+        return found
 
-    return list(sitemaps)
+    # robots.txt and the common fallbacks, all at once
+    robots, *fallbacks = await asyncio.gather(
+        from_robots(),
+        *(_probe(client, up.urljoin(base, cand)) for cand in ["/sitemap.xml", "/sitemap_index.xml"]),
+    )
+    return list(dict.fromkeys(robots + [url for url in fallbacks if url]))
 
 # ---- Robust XML helpers ----
+@functools.lru_cache(maxsize=256)  # sitemaps only use a handful of distinct tags
 def _local(tag: str) -> str:
-    return tag.split("}", 1)[1] if tag.startswith("{") else tag
+    """Lowercased tag name without its namespace"""
+    return (tag.split("}", 1)[1] if tag.startswith("{") else tag).lower()
 
 def _parse_lastmod(text: Optional[str]) -> Optional[dt.datetime]:
     if not text:
@@ -81,87 +99,106 @@ def _parse_lastmod(text: Optional[str]) -> Optional[dt.datetime]:
             continue
     return None
 
-def _iter_sitemap_index(root: ET.Element, max_child_sitemaps: int = 50) -> Iterator[str]:
-    """Walk a <sitemapindex>, newest child sitemaps first (by <lastmod>)."""
+def _inflate(gunzip, chunk: bytes):
+    """Decompress `chunk` in pieces of at most READ_CHUNK_SIZE bytes, so a highly compressed
+    chunk never expands into one large buffer"""
+    data = gunzip.decompress(chunk, READ_CHUNK_SIZE)
+    while data:
+        yield data
+        data = gunzip.decompress(gunzip.unconsumed_tail, READ_CHUNK_SIZE)
+
+async def _read_sitemap(client: httpx.AsyncClient, sitemap_url: str, prefix: str, limit: int
+                        ) -> Tuple[List[str], List[Tuple[str, Optional[dt.datetime]]]]:
+    """Stream one sitemap through an incremental parser.
+
+    Returns the URLs under `prefix` (stopping the download once there are `limit`) and, for a
+    <sitemapindex>, its child sitemaps as (loc, lastmod). Errors keep whatever was read so far.
+    """
+    urls: List[str] = []
     children: List[Tuple[str, Optional[dt.datetime]]] = []
-    # collect (loc, lastmod)
-    for sm in root.iter():
-        if _local(sm.tag).lower() == "sitemap":
-            print(sm)
-            loc_val, lastmod_val = None, None
-            for el in sm:
-                name = _local(el.tag).lower()
-                if name == "loc":
-                    loc_val = (el.text or "").strip()
-                elif name == "lastmod":
-                    lastmod_val = _parse_lastmod(el.text)
-            if loc_val:
-                children.append((loc_val, lastmod_val))
-
-    # newest first; None last
-    children.sort(key=lambda t: (t[1] is None, -(t[1].timestamp()) if t[1] else 0))
-
-    for loc, _ in children[:max_child_sitemaps]:
-        yield from _iter_sitemap_urls(loc, max_child_sitemaps=max_child_sitemaps)
-
-def _iter_xml_sitemap_urls(root: ET.Element, max_child_sitemaps: int = 50) -> Iterator[str]:
-    name = _local(root.tag).lower()
-
-    if name == "sitemapindex":
-        yield from _iter_sitemap_index(root, max_child_sitemaps=max_child_sitemaps)
-        return
-
-    if name == "urlset":
-        # normal URL set
-        for el in root.iter():
-            if _local(el.tag).lower() == "loc":
-                u = (el.text or "").strip()
-                if u:
-                    yield u
-        return
-
-    # last-resort: collect any <loc> we see
-    for el in root.iter():
-        if _local(el.tag).lower() == "loc":
-            u = (el.text or "").strip()
-            if u:
-                yield u
-
-def _iter_sitemap_urls(sitemap_url: str, *, max_child_sitemaps: int = 50) -> Iterator[str]:
-    print(sitemap_url)
-    try:
-        resp = _fetch(sitemap_url)
-        print(resp)
-        blob = _get_text(resp)
-        print(blob)
-    except Exception:
-        return
-
+    parser = ET.XMLPullParser(events=("start", "end"))
+    root, is_index, gunzip = None, False, None
     try:
-        root = ET.fromstring(blob)  # bytes OK
+        async with client.stream("GET", sitemap_url) as resp:
+            resp.raise_for_status()
+            async for chunk in resp.aiter_bytes(READ_CHUNK_SIZE):
+                if root is None and gunzip is None and chunk[:2] == b"\x1f\x8b":
+                    # gzip payload (sitemap.xml.gz), on top of any transport encoding httpx already undid
+                    gunzip = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                for data in (_inflate(gunzip, chunk) if gunzip else (chunk,)):
+                    parser.feed(data)
+                    for event, el in parser.read_events():
+                        if root is None:
+                            root = el
+                            is_index = _local(root.tag) == "sitemapindex"
+                            continue
+                        if event != "end":
+                            continue
+                        name = _local(el.tag)
+                        if is_index:
+                            if name == "sitemap":
+                                loc_val, lastmod_val = None, None
+                                for child in el:
+                                    child_name = _local(child.tag)
+                                    if child_name == "loc":
+                                        loc_val = (child.text or "").strip()
+                                    elif child_name == "lastmod":
+                                        lastmod_val = _parse_lastmod(child.text)
+                                if loc_val:
+                                    children.append((loc_val, lastmod_val))
+                                root.clear()  # drop the finished <sitemap> entries
+                        # normal URL set; anything else is a last resort where we collect any <loc> we see
+                        elif name == "loc":
+                            u = (el.text or "").strip()
+                            if u.startswith(prefix):
+                                urls.append(u)
+                                if len(urls) >= limit:
+                                    return urls, children
+                            el.clear()
+                        elif name == "url":
+                            root.clear()  # drop the finished <url> entries
     except Exception:
+        # unreachable, unparseable or truncated sitemap: keep what was read so far
         # (optional) you can add plain-text or RSS/Atom fallbacks here if you like
-        return
-
-    yield from _iter_xml_sitemap_urls(root, max_child_sitemaps=max_child_sitemaps)
+        logger.debug("Could not fully read sitemap %s", sitemap_url, exc_info=True)
+    logger.debug("Sitemap %s: %d matching URLs, %d child sitemaps", sitemap_url, len(urls), len(children))
+    return urls, children
 
-def discover_via_sitemaps(prefix: str, limit: int = 50, *, max_child_sitemaps: int = 50) -> List[str]:
+async def discover_via_sitemaps_async(prefix: str, limit: int = 50, *, max_child_sitemaps: int = 50,
+                                      concurrency: int = SITEMAP_CONCURRENCY) -> List[str]:
     prefix = _ensure_scheme(prefix)
     base = _domain_root(prefix)
-    print(base)
-    sitemaps = _discover_sitemaps(base)
-    print(sitemaps)
-    seen, out = set(), []
-
-    for sm in sitemaps:
-        for url in _iter_sitemap_urls(sm, max_child_sitemaps=max_child_sitemaps):
-            if url.startswith(prefix) and url not in seen:
-                seen.add(url)
-                out.append(url)
-                if len(out) >= limit:
-                    return out
+    async with httpx.AsyncClient(**CLIENT_OPTIONS) as client:
+        pending = await _discover_sitemaps(client, base)
+        logger.debug("Sitemaps found for %s: %s", base, pending)
+        seen, out = set(), []
+        visited = set()
+
+        while pending:
+            # Read the next few sitemaps concurrently; results are still merged in order
+            batch, pending = pending[:concurrency], pending[concurrency:]
+            visited.update(batch)
+            results = await asyncio.gather(*(_read_sitemap(client, sm, prefix, limit) for sm in batch))
+            child_sitemaps = []
+            for urls, children in results:
+                for url in urls:
+                    if url not in seen:
+                        seen.add(url)
+                        out.append(url)
+                        if len(out) >= limit:
+                            return out
+                # newest first; None last
+                children.sort(key=lambda t: (t[1] is None, -(t[1].timestamp()) if t[1] else 0))
+                child_sitemaps.extend(loc for loc, _ in children[:max_child_sitemaps])
+            # children of a sitemap index come before the remaining top-level sitemaps
+            pending = [sm for sm in dict.fromkeys(child_sitemaps) if sm not in visited] + pending
     return out
 
-# Example:
-urls = discover_via_sitemaps("https://www.wikipedia.org/", limit=30, max_child_sitemaps=25)
-print("\n".join(urls))
\ No newline at end of file
+def discover_via_sitemaps(prefix: str, limit: int = 50, *, max_child_sitemaps: int = 50) -> List[str]:
+    return asyncio.run(discover_via_sitemaps_async(prefix, limit, max_child_sitemaps=max_child_sitemaps))
+
+if __name__ == "__main__":
+    # Example:
+    logging.basicConfig(level=logging.WARNING)
+    urls = discover_via_sitemaps("https://www.wikipedia.org/", limit=30, max_child_sitemaps=25)
+    print("\n".join(urls))
@@ -4,14 +4,20 @@ CLI for parser evaluation with domain, input URLs, and validation URLs.
 """
 
 import argparse
+import asyncio
 import sys
 from typing import List, Optional
+import httpx
+import numpy as np
+from rapidfuzz.distance import Levenshtein
+from rapidfuzz.process import cpdist
 import os
 from datetime import datetime
 
 from db import save
 from data_models import EvaluationRun, SampleURL, URLPrefix, EvaluationResult, EvaluationResults
 from parser import ParserGenerator
+from load_html import CLIENT_OPTIONS, load_many_raw_html
 from paths import EVALS_PATH
 
 
@@ -22,14 +28,7 @@ def aggregate_evaluation_results(evaluation_results: List[EvaluationResult],
         evaluation_results = [result for result in evaluation_results if result.domain == domain]
     if config_name is not None:
         evaluation_results = [result for result in evaluation_results if result.config_name == config_name]
-    return EvaluationResults(
-        levenshtein_distance_norm=sum([result.levenshtein_distance_norm for result in evaluation_results]) / len(evaluation_results),
-        exact_match=sum([result.exact_match for result in evaluation_results]) / len(evaluation_results),
-        missing_content=sum([result.missing_content for result in evaluation_results]) / len(evaluation_results),
-        extra_content=sum([result.extra_content for result in evaluation_results]) / len(evaluation_results),
-        domain=domain,
-        config_name=config_name
-    )
+    return EvaluationResults.from_results(evaluation_results, domain=domain, config_name=config_name)
 
 
 def list_domains(domains: Optional[list[str]] = None) -> list[str]:
@@ -39,34 +38,45 @@ def list_domains(domains: Optional[list[str]] = None) -> list[str]:
 
 
 def eval_parser_generator(parser_generator: ParserGenerator, config_name: str = None, domains: list[str] = None) -> list[EvaluationResult]:
-    evaluation_results = []
+    # (sample_url, parsed_content, domain) for every labelled validation URL, scored together below
+    labelled = []
     for domain in list_domains(domains):
         url_prefix = URLPrefix.from_evals(domain)
         parser = parser_generator.generate_parser(url_prefix)
         for sample_url in url_prefix.validation_urls:
             parsed_content = parser.parse(sample_url.raw_content)
             if sample_url.label is not None:
-                evaluation_result = sample_url.evaluate(parsed_content, config_name, domain)
-                evaluation_results.append(evaluation_result)
+                labelled.append((sample_url, parsed_content, domain))
             else:
                 print(f"Sample URL: {sample_url.url}")
                 print(f"Parsed content: {parsed_content}")
                 print("---")
-    return evaluation_results
+    if not labelled:
+        return []
+    # One pairwise call computes every label/parsed distance, using all cores
+    distances = cpdist([sample_url.label.content for sample_url, _, _ in labelled],
+                       [parsed_content for _, parsed_content, _ in labelled],
+                       scorer=Levenshtein.normalized_distance, dtype=np.float64, workers=-1)
+    return [sample_url.evaluate(parsed_content, config_name, domain, float(levenshtein_distance_norm))
+            for (sample_url, parsed_content, domain), levenshtein_distance_norm in zip(labelled, distances)]
+
+
+async def _load_sample_urls(urls: List[str]) -> list:
+    # A client per call: asyncio.run gives every call its own event loop
+    async with httpx.AsyncClient(**CLIENT_OPTIONS) as client:
+        return await load_many_raw_html(urls, client)
 
 
 def create_sample_urls(urls: List[str]) -> List[SampleURL]:
-    """Create SampleURL objects from a list of URLs."""
+    """Create SampleURL objects from a list of URLs, fetching them concurrently."""
     sample_urls = []
     
-    for url in urls:
-        print(f"Loading content from: {url}")
-        try:
-            sample_url = SampleURL.from_url(url)
-            sample_urls.append(sample_url)
-        except Exception as e:
-            print(f"Error loading {url}: {e}")
+    print(f"Loading content from {len(urls)} URLs")
+    for url, raw_content in zip(urls, asyncio.run(_load_sample_urls(urls))):
+        if isinstance(raw_content, Exception):
+            print(f"Error loading {url}: {raw_content}")
             continue
+        sample_urls.append(SampleURL(url=url, raw_content=raw_content))
     
     return sample_urls
 
@@ -138,7 +148,7 @@ def main():
             # aggregated_evaluation_results.append(config_aggregated_evaluation_results)
             evaluation_results.extend(config_evaluation_results)
         evaluation_run = EvaluationRun(results=evaluation_results, datetime_str=datetime.now().isoformat(), config_name=config_name)
-        save(evaluation_run)
+        asyncio.run(save(evaluation_run))
         # for domain in list_domains(args.domain):
         #     domain_aggregated_evaluation_results = aggregate_evaluation_results(evaluation_results, domain=domain)
         #     aggregated_evaluation_results.append(domain_aggregated_evaluation_results)
@@ -1,24 +1,81 @@
-import requests
+import asyncio
+from typing import Optional
+
+import httpx
 from pathlib import Path
 
 
 UA = "parser-generator/1.0 (jan.vegt@gmail.com)"
 headers = {"User-Agent": UA}
 
+# Pooled clients: connections (and TLS sessions) are reused across fetches, HTTP/2 where the server supports it
+CLIENT_OPTIONS = dict(
+    headers=headers,
+    http2=True,
+    follow_redirects=True,
+    timeout=httpx.Timeout(30.0, connect=10.0),
+    limits=httpx.Limits(max_connections=32),
+)
+FETCH_CONCURRENCY = 8
+
+_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.Client:
+    global _client
+    if _client is None:
+        _client = httpx.Client(**CLIENT_OPTIONS)
+    return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Shared client for long-running event loops (API, workers); one-off scripts should open their own"""
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(**CLIENT_OPTIONS)
+    return _async_client
+
+
+async def close_async_client() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
 
 def load_raw_html(url: str) -> str:
-    response = requests.get(url, headers=headers)
+    response = get_client().get(url)
     response.raise_for_status()
     return response.text
 
 
+async def load_raw_html_async(url: str, client: Optional[httpx.AsyncClient] = None) -> str:
+    response = await (client or get_async_client()).get(url)
+    response.raise_for_status()
+    return response.text
+
+
+async def load_many_raw_html(urls: list[str], client: Optional[httpx.AsyncClient] = None,
+                             concurrency: int = FETCH_CONCURRENCY) -> list:
+    """Fetch several URLs concurrently, at most `concurrency` at a time.
+    Results are in the order of `urls`; a failed fetch gives its exception instead of the HTML."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(url: str) -> str:
+        async with semaphore:
+            return await load_raw_html_async(url, client)
+
+    return await asyncio.gather(*(fetch(url) for url in urls), return_exceptions=True)
+
+
 def load_html_to_file(url: str, output_path: str) -> None:
     """Load HTML from a URL and write it to a file path."""
     html_content = load_raw_html(url)
-    
+
     # Ensure the directory exists
     Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-    
+
     # Write the HTML content to the file
     with open(output_path, 'w', encoding='utf-8') as f:
         f.write(html_content)
@@ -3,9 +3,14 @@ from prometheus_client.core import REGISTRY, GaugeMetricFamily
 
 
 class RedisModelCollector:
-    def __init__(self, count_fn, model_types):
-        self.count_fn = count_fn
+    def __init__(self, count_many_fn, model_types):
+        self.count_many_fn = count_many_fn
         self.model_types = model_types
+        self.counts = {}
+
+    async def refresh(self):
+        """Fetch the current counts; collect() runs synchronously and only reports these."""
+        self.counts = await self.count_many_fn(self.model_types)
 
     def collect(self):
         g = GaugeMetricFamily(
@@ -16,14 +21,19 @@ class RedisModelCollector:
         for m in self.model_types:
             # Convert class to string name for the label
             model_name = m.__name__ if hasattr(m, '__name__') else str(m)
-            g.add_metric([model_name], float(self.count_fn(m) or 0))
+            g.add_metric([model_name], float(self.counts.get(m) or 0))
         yield g
 
 
 class RedisQueueCollector:
-    def __init__(self, queue_len_fn, model_types):
-        self.queue_len_fn = queue_len_fn
+    def __init__(self, queue_lengths_fn, model_types):
+        self.queue_lengths_fn = queue_lengths_fn
         self.model_types = model_types
+        self.lengths = {}
+
+    async def refresh(self):
+        """Fetch the current queue lengths; collect() runs synchronously and only reports these."""
+        self.lengths = await self.queue_lengths_fn(self.model_types)
 
     def collect(self):
         g = GaugeMetricFamily(
@@ -33,5 +43,5 @@ class RedisQueueCollector:
         )
         for m in self.model_types:
             model_name = m.__name__ if hasattr(m, '__name__') else str(m)
-            g.add_metric([model_name], float(self.queue_len_fn(model_class=m) or 0))
+            g.add_metric([model_name], float(self.lengths.get(m) or 0))
         yield g
@@ -1,127 +1,236 @@
-from functools import reduce
+import asyncio
+from functools import lru_cache
+import httpx
 import openai
-from bs4 import BeautifulSoup, Tag, NavigableString
+import lxml.html
+from lxml import etree
+from lxml.cssselect import CSSSelector
+from lxml.html import HtmlElement
 from typing import Iterable, List, Optional
 import re
+from pydantic import BaseModel
 
 
-from clean_html import clean_html
-from data_models import ParserParameters, URLPrefix, ParserGeneratorConfig, ParserConfig, SampleURL
+from clean_html import clean_html, clean_html_async
+from data_models import ParserParameters, ParserParametersPatch, URLPrefix, ParserGeneratorConfig, ParserConfig, SampleURL
 
 
-client = openai.OpenAI()
+# Keep-alive pool sized for concurrent reflection requests, over HTTP/2, so calls reuse connections
+# (and TLS sessions) instead of handshaking again
+OPENAI_HTTP_OPTIONS = dict(
+    http2=True,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=60),
+)
+
+# Shared client for long-running event loops (workers); one-off scripts go through generate_parser, which opens its own
+_async_client: Optional[openai.AsyncOpenAI] = None
+
+
+def new_async_openai() -> openai.AsyncOpenAI:
+    return openai.AsyncOpenAI(http_client=openai.DefaultAsyncHttpxClient(**OPENAI_HTTP_OPTIONS))
+
+
+def get_async_openai() -> openai.AsyncOpenAI:
+    global _async_client
+    if _async_client is None:
+        _async_client = new_async_openai()
+    return _async_client
+
+# Elements whose contents aren't page text (the ones BeautifulSoup's get_text leaves out)
+_NON_TEXT_TAGS = ("script", "style", "template", "rp", "rt")
+# Document text in order, without the contents of those elements
+_TEXT_NODES = etree.XPath(
+    "//text()[not(" + " or ".join(f"ancestor::{tag}" for tag in _NON_TEXT_TAGS) + ")]"
+)
+# Declared encoding, so a <meta charset> in the page can't make lxml misread the UTF-8 it is given
+_HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+_SPACES_RE = re.compile(r"[ \t]+")
+_NEWLINES_RE = re.compile(r"\n{3,}")
+# lxml merges neighbouring text when an element is dropped or unwrapped, so the end of every text node of
+# the parsed page is marked; the output then still separates the page's original strings with a space.
+# Whitespace-only nodes are left alone: they are stripped away, and the node before them carries a mark.
+_TEXT_BOUNDARY = "\ue000"
+
+
+def _mark_text_boundaries(tree: HtmlElement) -> None:
+    for el in tree.iter():
+        text = el.text
+        if text and not text.isspace() and isinstance(el.tag, str):
+            el.text = text + _TEXT_BOUNDARY
+        tail = el.tail
+        if tail and not tail.isspace():
+            el.tail = tail + _TEXT_BOUNDARY
+
+
+def _parse_document(content: str) -> Optional[HtmlElement]:
+    """Parse `content` into an lxml tree, or None when there is no document to parse"""
+    if not content.strip():
+        return None
+    try:
+        # libxml2 reads UTF-8 bytes natively; a str would be converted inside lxml anyway
+        return lxml.html.document_fromstring(content.encode("utf-8", "replace"), parser=_HTML_PARSER)
+    except etree.ParserError:
+        return None
+
+
+@lru_cache(maxsize=1024)
+def _compile_selector(selector: str) -> CSSSelector:
+    """CSS selector compiled to XPath once and shared by every parser and page that uses it;
+    an invalid selector still raises when the page is parsed"""
+    return CSSSelector(selector, translator="html")
+
+
+def _select(tree: HtmlElement, selector: str) -> list[HtmlElement]:
+    return _compile_selector(selector)(tree)
+
+
+def _unwrap(el: HtmlElement) -> None:
+    """Replace an element by its contents"""
+    if el.getparent() is None:
+        # the document element can't be taken out of an lxml tree; without its name and attributes
+        # later selectors no longer match it, as if it had been unwrapped
+        el.tag = "unwrapped-root"
+        el.attrib.clear()
+        return
+    if el.tag in _NON_TEXT_TAGS:
+        # the contents stay out of the text once the element is gone
+        for child in el.iterdescendants():
+            child.tail = None
+            if isinstance(child.tag, str):
+                child.text = None
+        el.text = None
+    el.drop_tag()
+
+
+def _keep_only(tree: HtmlElement, nodes: List[HtmlElement]) -> None:
+    """Drop every element except `nodes`, their ancestors and their descendants (<html>, <head> and
+    <body> always stay) in one top-down pass that skips the subtrees of kept and dropped elements"""
+    kept = set(nodes)
+    if tree in kept:
+        return
+    ancestors = set()
+    for node in nodes:
+        for ancestor in node.iterancestors():
+            if ancestor in ancestors:
+                break
+            ancestors.add(ancestor)
+
+    pending = [tree]
+    while pending:
+        for child in list(pending.pop()):
+            if not isinstance(child.tag, str) or child in kept:
+                continue
+            if child in ancestors or child.tag in ("html", "head", "body"):
+                pending.append(child)
+            else:
+                child.drop_tree()
 
 
 class Parser:
     def __init__(self, config: ParserConfig):
         self.config = config
+        parameters = config.parameters
+        # A config with no selectors at all leaves the tree as is, so trimming can be skipped outright
+        self._has_trim = bool(parameters.root or parameters.drop or parameters.unwrap or parameters.keep)
 
-    def _first_match(self, soup: BeautifulSoup, selectors: Iterable[str]) -> Optional[Tag]:
+    def _first_match(self, tree: HtmlElement, selectors: Iterable[str]) -> Optional[HtmlElement]:
         for sel in selectors or []:
-            el = soup.select_one(sel)
-            if el:
-                return el
+            matches = _select(tree, sel)
+            if matches:
+                return matches[0]
         return None
 
-    def _trim_soup(self, soup: BeautifulSoup) -> BeautifulSoup:
+    def _trim_tree(self, tree: HtmlElement) -> Optional[HtmlElement]:
+        if not self._has_trim:
+            return tree
+
         if self.config.parameters.root:
             roots = []
             for sel in self.config.parameters.root:
-                roots.extend(soup.select(sel))
+                roots.extend(_select(tree, sel))
 
             if roots:
-                keep_set = set()
-                for r in roots:
-                    keep_set.add(id(r))
-                    for d in r.descendants:
-                        if isinstance(d, Tag):
-                            keep_set.add(id(d))
-                    for p in r.parents:
-                        if isinstance(p, Tag):
-                            keep_set.add(id(p))
-
-                for el in list(soup.find_all(True)):
-                    if el.name in ("html", "head", "body"):
-                        continue
-                    if id(el) not in keep_set:
-                        el.decompose()
+                _keep_only(tree, roots)
 
         # 1. Drop unwanted elements
         if self.config.parameters.drop:
             for selector in self.config.parameters.drop:
-                for el in soup.select(selector):
-                    el.decompose()
+                for el in _select(tree, selector):
+                    if el.getparent() is None:
+                        return None  # the whole document is dropped
+                    el.drop_tree()
 
         # 2) Unwrap elements (remove tag but keep its children)
         if self.config.parameters.unwrap:
             for selector in self.config.parameters.unwrap:
-                for el in soup.select(selector):
-                    el.unwrap()
+                for el in _select(tree, selector):
+                    _unwrap(el)
         
         # 3) Keep-only pruning (preserve kept nodes, their ancestors, and descendants)
         if self.config.parameters.keep:
-            keep_nodes: List[Tag] = []
+            keep_nodes: List[HtmlElement] = []
             for selector in self.config.parameters.keep:
-                keep_nodes.extend(soup.select(selector))
+                keep_nodes.extend(_select(tree, selector))
 
             if keep_nodes:
-                keep_set = set()
-
-                # Add kept nodes, their ancestors, and descendants
-                for kn in keep_nodes:
-                    keep_set.add(id(kn))
-                    # ancestors up to <body>/<html>
-                    for p in kn.parents:
-                        if isinstance(p, Tag):
-                            keep_set.add(id(p))
-                    # all descendants
-                    for d in kn.descendants:
-                        if isinstance(d, Tag):
-                            keep_set.add(id(d))
-
-                # Walk the tree and drop anything not in keep_set
-                # Iterate over a static list to avoid mutation during traversal issues
-                for el in list(soup.find_all(True)):
-                    if el.name in ("html", "head", "body"):
-                        continue
-                    if id(el) not in keep_set:
-                        el.decompose()
-            
-        return soup
-
-    def _soup_to_text(self, soup: BeautifulSoup) -> str:
-        soup = clean_html(soup)
-
-        # ensure block elements break lines
-        blockish = {
-            "p","div","section","article","header","footer","aside","main","nav",
-            "h1","h2","h3","h4","h5","h6","li","ul","ol","table","thead","tbody",
-            "tr","td","th","figure","figcaption","pre"
-        }
-        for tag in soup.find_all(blockish):
-            # add a newline before/after so get_text() separates blocks
-            tag.insert_before(NavigableString("\n"))
-            tag.append(NavigableString("\n"))
-
-        text = soup.get_text(separator=" ", strip=True)
+                _keep_only(tree, keep_nodes)
+
+        return tree
+
+    def _tree_to_text(self, tree: HtmlElement) -> str:
+        tree = clean_html(tree)
+
+        # every original string, stripped, one space between strings
+        strings = (string.strip() for node in _TEXT_NODES(tree) for string in node.split(_TEXT_BOUNDARY))
+        text = " ".join(string for string in strings if string)
 
         # normalize whitespace and keep reasonable paragraph breaks
-        text = re.sub(r"[ \t]+", " ", text)        # collapse runs of spaces
-        text = re.sub(r"\n{3,}", "\n\n", text)     # max two blank lines
+        text = _SPACES_RE.sub(" ", text)        # collapse runs of spaces
+        text = _NEWLINES_RE.sub("\n\n", text)   # max two blank lines
         text = text.strip()
 
         return text
 
     def parse(self, content: str) -> str:
-        soup = BeautifulSoup(content, "lxml")
-        soup = self._trim_soup(soup)
-        text = self._soup_to_text(soup)
+        tree = _parse_document(content)
+        if tree is None:
+            return ""
+        _mark_text_boundaries(tree)
+        tree = self._trim_tree(tree)
+        if tree is None:
+            return ""
+        text = self._tree_to_text(tree)
         return text
 
 
+def _build_parser_parameters_format(model: type[BaseModel] = ParserParameters, name: str = "parser_config") -> dict:
+    schema = model.model_json_schema()
+    schema["additionalProperties"] = False
+    
+    format = {
+        "type": "json_schema",
+        "name": name,
+        "strict": True,
+        "schema": schema,
+    }
+    return format
+
+
+# Structured-output formats for the generation requests; the schemas are generated once, not per request
+_PARSER_PARAMETERS_FORMAT = _build_parser_parameters_format()
+# Error retries answer with a patch to the previous config, usually a selector or two, instead of a whole new config
+_PARSER_PARAMETERS_PATCH_FORMAT = _build_parser_parameters_format(ParserParametersPatch, "parser_config_patch")
+_PATCH_PROMPT = ("Answer with a patch to the previous parser config instead of a full parser config: "
+                 "for each of root, keep, drop and unwrap, the selectors to add and the selectors to remove. "
+                 "Leave a list empty when it needs no change.")
+
+
 class ParserGenerator:
-    def __init__(self, config: ParserGeneratorConfig):
+    def __init__(self, config: ParserGeneratorConfig, client: Optional[openai.AsyncOpenAI] = None):
         self.config = config
+        self.client = client if client is not None else get_async_openai()
+        # id(sample_url) -> cleaned HTML, filled once per generate_parser_async call and reused by every prompt
+        self._clean_cache: dict[int, str] = {}
 
     @classmethod
     def from_config(cls, config_name: str) -> "ParserGenerator":
@@ -129,7 +238,9 @@ class ParserGenerator:
         return cls(config=config)
 
     def _generate_html_content_snippet(self, sample_url: SampleURL) -> str:
-        cleaned_content = clean_html(sample_url.raw_content)
+        cleaned_content = self._clean_cache.get(id(sample_url))
+        if cleaned_content is None:
+            cleaned_content = self._clean_cache[id(sample_url)] = clean_html(sample_url.raw_content)
         return f"{cleaned_content}"
 
     def _generate_input_prompt(self,
@@ -158,24 +269,15 @@ class ParserGenerator:
         )
 
     def _format_parser_parameters(self) -> dict:
-        schema = ParserParameters.model_json_schema()
-        schema["additionalProperties"] = False
-        
-        format = {
-            "type": "json_schema",
-            "name": "parser_config",
-            "strict": True,
-            "schema": schema,
-        }
-        return format
+        return _PARSER_PARAMETERS_FORMAT
 
 
-    def _generate_parser_num_examples(self, url_prefix: URLPrefix, num_examples: int) -> Parser:
+    async def _generate_parser_num_examples(self, url_prefix: URLPrefix, num_examples: int) -> Parser:
         input_prompt = self._generate_input_prompt(url_prefix.sample_urls[:num_examples])
 
         format = self._format_parser_parameters()
 
-        response = client.responses.create(
+        response = await self.client.responses.create(
             model=self.config.openai_model,
             instructions=self.config.instructions_prompt,
             reasoning={"effort": self.config.reasoning_level},
@@ -186,63 +288,108 @@ class ParserGenerator:
         parser_config = ParserConfig(parameters=parser_parameters, prefix_name=url_prefix.prefix)
         return Parser(config=parser_config)
 
-    def _generate_parser_with_parsing_mistake(self, sample_url: SampleURL, previous_parser_config: ParserConfig, error_message: str) -> ParserConfig:
-        input_prompt = self._generate_input_prompt([sample_url], previous_parser_config, error_message)
-        format = self._format_parser_parameters()
-        response = client.responses.create(
+    async def _generate_parser_with_parsing_mistake(self, sample_url: SampleURL, previous_parser_config: ParserConfig, error_message: str) -> Parser:
+        input_prompt = self._generate_input_prompt([sample_url], previous_parser_config, error_message=error_message)
+        response = await self.client.responses.create(
             model=self.config.openai_model,
-            instructions=self.config.instructions_prompt + "\n" + self.config.error_prompt,
+            instructions=self.config.instructions_prompt + "\n" + self.config.error_prompt + "\n" + _PATCH_PROMPT,
             reasoning={"effort": "minimal"},
             input=input_prompt,
-            text={"format": format},
+            text={"format": _PARSER_PARAMETERS_PATCH_FORMAT},
         )
-        parser_parameters = ParserParameters.model_validate_json(response.output_text, strict=True)
-        parser_config = ParserConfig(parameters=parser_parameters, prefix_name=previous_parser_config.prefix_name)
-        return parser_config
+        patch = ParserParametersPatch.model_validate_json(response.output_text, strict=True)
+        parser_config = ParserConfig(parameters=patch.apply(previous_parser_config.parameters),
+                                     prefix_name=previous_parser_config.prefix_name)
+        return Parser(config=parser_config)
 
-    def _validate_parser(self, parser: Parser, sample_urls: list[SampleURL]) -> Optional[tuple[SampleURL, str]]:
-        for sample_url in sample_urls:
-            try:
-                parser.parse(sample_url.raw_content)
-            except Exception as e:
-                return (sample_url, str(e))
+    async def _validate_parser(self, parser: Parser, sample_urls: list[SampleURL]) -> Optional[tuple[SampleURL, str]]:
+        # The samples are parsed side by side on worker threads (lxml drops the GIL while it parses),
+        # which also keeps the event loop free; the first failure in sample order is reported
+        results = await asyncio.gather(
+            *(asyncio.to_thread(parser.parse, sample_url.raw_content) for sample_url in sample_urls),
+            return_exceptions=True,
+        )
+        for sample_url, result in zip(sample_urls, results):
+            if isinstance(result, Exception):
+                return (sample_url, str(result))
         return None
     
-    def _reflect_on_parser(self, parser: Parser, sample_urls: list[SampleURL], prefix_name: str) -> ParserConfig:
+    async def _reflect_on_parser(self, parser: Parser, sample_urls: list[SampleURL], prefix_name: str) -> ParserConfig:
         format = self._format_parser_parameters()
-        parser_configs = []
-        for sample_url in sample_urls:
-            parsed_content = parser.parse(sample_url.raw_content)
-            input_prompt = self._generate_input_prompt([sample_url], parser.config, [parsed_content])
-            response = client.responses.create(
+        # Parsed on worker threads like in _validate_parser, so the event loop isn't blocked on the parses
+        parsed_contents = await asyncio.gather(
+            *(asyncio.to_thread(parser.parse, sample_url.raw_content) for sample_url in sample_urls)
+        )
+        input_prompts = [
+            self._generate_input_prompt([sample_url], parser.config, [parsed_content])
+            for sample_url, parsed_content in zip(sample_urls, parsed_contents)
+        ]
+        # The reflections are independent, so they are requested all at once
+        responses = await asyncio.gather(*(
+            self.client.responses.create(
                 model=self.config.openai_model,
                 instructions=self.config.instructions_prompt + "\n" + self.config.reflection_prompt,
                 reasoning={"effort": "minimal"},
                 input=input_prompt,
                 text={"format": format},
             )
-            parser_parameters = ParserParameters.model_validate_json(response.output_text, strict=True)
-            parser_config = ParserConfig(parameters=parser_parameters, prefix_name=prefix_name)
-            parser_configs.append(parser_config)
-        return reduce(lambda x, y: x + y, parser_configs)
+            for input_prompt in input_prompts
+        ))
+        all_parameters = [ParserParameters.model_validate_json(response.output_text, strict=True)
+                          for response in responses]
+        # Union every reflection's selectors in one go and build a single config from them
+        merged_parameters = ParserParameters(
+            root=frozenset().union(*(parameters.root for parameters in all_parameters)),
+            keep=frozenset().union(*(parameters.keep for parameters in all_parameters)),
+            drop=frozenset().union(*(parameters.drop for parameters in all_parameters)),
+            unwrap=frozenset().union(*(parameters.unwrap for parameters in all_parameters)),
+        )
+        return ParserConfig(parameters=merged_parameters, prefix_name=prefix_name)
 
     def generate_parser(self, url_prefix: URLPrefix) -> Parser:
+        """Blocking variant of generate_parser_async for scripts. asyncio.run gives every call a new event loop,
+        so the call gets an OpenAI client of its own."""
+        async def generate() -> Parser:
+            async with new_async_openai() as client:
+                return await ParserGenerator(self.config, client).generate_parser_async(url_prefix)
+        return asyncio.run(generate())
+
+    async def generate_parser_async(self, url_prefix: URLPrefix) -> Parser:
+        # Identical pages (common on paginated sites) add prompt tokens and validation work but no information
+        seen_contents = set()
+        unique_samples = []
+        for sample_url in url_prefix.sample_urls:
+            if sample_url.raw_content not in seen_contents:
+                seen_contents.add(sample_url.raw_content)
+                unique_samples.append(sample_url)
+        if len(unique_samples) < len(url_prefix.sample_urls):
+            url_prefix = url_prefix.model_copy(update={"sample_urls": unique_samples})
+        # Every prompt (initial, error retry, reflection) embeds cleaned samples: clean each one once, in worker processes
+        cleaned_contents = await asyncio.gather(
+            *(clean_html_async(sample_url.raw_content) for sample_url in url_prefix.sample_urls)
+        )
+        self._clean_cache = {id(sample_url): cleaned for sample_url, cleaned in zip(url_prefix.sample_urls, cleaned_contents)}
+        try:
+            return await self._generate_parser(url_prefix)
+        finally:
+            self._clean_cache = {}
+
+    async def _generate_parser(self, url_prefix: URLPrefix) -> Parser:
         num_examples = len(url_prefix.sample_urls)
         success = False
         while num_examples > 0 and not success:
             try:
-                parser = self._generate_parser_num_examples(url_prefix, num_examples)
-                validation_result = self._validate_parser(parser, url_prefix.sample_urls)
+                parser = await self._generate_parser_num_examples(url_prefix, num_examples)
+                validation_result = await self._validate_parser(parser, url_prefix.sample_urls)
                 if validation_result:
                     print(f"Validation failed with error: {validation_result}")
                     sample_url, error_message = validation_result
                     if self.config.error_prompt is not None:
-                        parser = self._generate_parser_with_parsing_mistake(sample_url, parser.config, error_message)
-                        validation_result = self._validate_parser(parser, url_prefix.sample_urls)
+                        parser = await self._generate_parser_with_parsing_mistake(sample_url, parser.config, error_message)
+                        validation_result = await self._validate_parser(parser, url_prefix.sample_urls)
                     if validation_result:
                         raise Exception(f"Failed to generate parser with error: {error_message}")
-                else:
-                    success = True
+                success = True
             except Exception as e:
                 if "Your input exceeds the context window of this model" in str(e):
                     num_examples -= 1
@@ -251,7 +398,7 @@ class ParserGenerator:
         if success:
             if self.config.reflection_prompt is not None:
                 print("Reflection on parser")
-                parser_configs = self._reflect_on_parser(parser, url_prefix.sample_urls, url_prefix.prefix)
+                parser_configs = await self._reflect_on_parser(parser, url_prefix.sample_urls, url_prefix.prefix)
                 parser = Parser(config=parser_configs)
                 return parser
             else:
@@ -1,16 +1,16 @@
 from __future__ import annotations
 from typing import Optional, TypeVar
 from pydantic import BaseModel
-import orjson
 
-from redis_utils import get_redis
+from redis_utils import get_async_redis
+from db import validate_many
 
 T = TypeVar('T', bound=BaseModel)
 
-R = get_redis()
+R = get_async_redis()
 
 
-def add_to_queue(model: BaseModel, queue_name: Optional[str] = None) -> bool:
+async def add_to_queue(model: BaseModel, queue_name: Optional[str] = None) -> bool:
     """
     Add a BaseModel instance to a queue in Redis.
     
@@ -27,17 +27,64 @@ def add_to_queue(model: BaseModel, queue_name: Optional[str] = None) -> bool:
             queue_name = f"queue:{model.__class__.__name__.lower()}"
         
         # Serialize the model to JSON
-        serialized_data = orjson.dumps(model.model_dump())
+        serialized_data = model.__pydantic_serializer__.to_json(model)
         
         # Add to Redis list (queue)
-        R.lpush(queue_name, serialized_data)
+        await R.lpush(queue_name, serialized_data)
         return True
     except Exception as e:
         print(f"Error adding model to queue {queue_name}: {e}")
         return False
 
 
-def get_from_queue(model_class: Type[T], queue_name: Optional[str] = None) -> Optional[T]:
+async def add_many_to_queue(models: list[BaseModel], queue_name: Optional[str] = None) -> int:
+    """
+    Add several BaseModel instances to a queue in Redis in one round trip.
+    
+    Args:
+        models: The BaseModel instances to add, in the order they should be consumed
+        queue_name: Optional custom queue name. If None, derived from the first model's class name.
+        
+    Returns:
+        int: The number of instances added (0 if there were none or an error occurs)
+    """
+    if not models:
+        return 0
+    try:
+        # Auto-derive queue name from model class if not provided
+        if queue_name is None:
+            queue_name = f"queue:{models[0].__class__.__name__.lower()}"
+        
+        # One variadic LPUSH; the items land left of each other in order, so they are consumed (from the right) in order
+        await R.lpush(queue_name, *(model.__pydantic_serializer__.to_json(model) for model in models))
+        return len(models)
+    except Exception as e:
+        print(f"Error adding models to queue {queue_name}: {e}")
+        return 0
+
+
+async def add_to_queues(models: list[BaseModel]) -> bool:
+    """
+    Add BaseModel instances, possibly of different classes, each to its own class's queue in one round trip.
+    
+    Args:
+        models: The BaseModel instances to add; queue names are derived from their class names
+        
+    Returns:
+        bool: True if all were successfully added, False otherwise
+    """
+    try:
+        async with R.pipeline(transaction=False) as pipe:
+            for model in models:
+                pipe.lpush(f"queue:{model.__class__.__name__.lower()}", model.__pydantic_serializer__.to_json(model))
+            await pipe.execute()
+        return True
+    except Exception as e:
+        print(f"Error adding models to queues: {e}")
+        return False
+
+
+async def get_from_queue(model_class: Type[T], queue_name: Optional[str] = None) -> Optional[T]:
     """
     Get a BaseModel instance from a queue in Redis.
     
@@ -54,22 +101,219 @@ def get_from_queue(model_class: Type[T], queue_name: Optional[str] = None) -> Op
             queue_name = f"queue:{model_class.__name__.lower()}"
         
         # Get item from Redis list (queue) - pops from the right (FIFO)
-        serialized_data = R.rpop(queue_name)
+        serialized_data = await R.rpop(queue_name)
         
         if serialized_data is None:
             return None
             
-        # Deserialize the JSON data
-        data = orjson.loads(serialized_data)
+        # Deserialize and validate the JSON data in one step
+        return model_class.model_validate_json(serialized_data)
+    except Exception as e:
+        print(f"Error getting model from queue {queue_name}: {e}")
+        return None
+
+
+def processing_queue_name(queue_name: str, consumer_id: str) -> str:
+    """List holding the items of `queue_name` that one consumer has taken but not yet acknowledged"""
+    return f"{queue_name}:processing:{consumer_id}"
+
+
+def heartbeat_key(queue_name: str, consumer_id: str) -> str:
+    """Key that exists while the consumer is alive; it expires if the consumer stops refreshing it"""
+    return f"{queue_name}:heartbeat:{consumer_id}"
+
+
+def consumers_key(queue_name: str) -> str:
+    """Set of the ids of the consumers that have a processing list for `queue_name`"""
+    return f"{queue_name}:consumers"
+
+
+async def heartbeat(consumer_id: str, ttl: int, model_class: Optional[Type[T]] = None,
+                    queue_name: Optional[str] = None) -> bool:
+    """
+    Register a reliable-queue consumer and mark it alive for the next `ttl` seconds.
+    A consumer calls this periodically, well within `ttl`; once it stops, its unacknowledged
+    items are moved back to the queue by requeue_stale_processing.
+    
+    Args:
+        consumer_id: Id of the consumer, unique among the running consumers
+        ttl: Seconds the consumer counts as alive without another heartbeat
+        model_class: Optional model class to derive queue name from if queue_name is None.
+        queue_name: Optional custom queue name. If None, derived from model_class.
+        
+    Returns:
+        bool: True if the heartbeat was recorded, False otherwise
+    """
+    try:
+        # Auto-derive queue name from model class if not provided
+        if queue_name is None:
+            if model_class is None:
+                raise ValueError("Either queue_name or model_class must be provided")
+            queue_name = f"queue:{model_class.__name__.lower()}"
+        
+        async with R.pipeline(transaction=True) as pipe:
+            pipe.set(heartbeat_key(queue_name, consumer_id), 1, ex=ttl)
+            pipe.sadd(consumers_key(queue_name), consumer_id)
+            await pipe.execute()
+        return True
+    except Exception as e:
+        print(f"Error recording heartbeat for queue {queue_name}: {e}")
+        return False
+
+
+async def get_from_queue_reliable(model_class: Type[T], consumer_id: str, timeout: int = 5,
+                                  queue_name: Optional[str] = None) -> Optional[tuple[T, bytes]]:
+    """
+    Get a BaseModel instance from a queue in Redis, moving it to the consumer's processing list
+    instead of removing it, so the item survives a consumer crash.
+    
+    Args:
+        model_class: The class of the BaseModel to deserialize
+        consumer_id: Id of the consumer taking the item, as passed to heartbeat
+        timeout: Seconds to wait for an item before giving up (0 waits forever)
+        queue_name: Optional custom queue name. If None, derived from model class name.
+        
+    Returns:
+        Optional[tuple[T, bytes]]: The deserialized model instance and its serialized form, which is
+        passed to ack_from_queue once the item is handled; None if nothing arrived in time or an error occurs
+    """
+    try:
+        # Auto-derive queue name from model class if not provided
+        if queue_name is None:
+            queue_name = f"queue:{model_class.__name__.lower()}"
+        processing_queue = processing_queue_name(queue_name, consumer_id)
         
-        # Create model instance
-        return model_class(**data)
+        # BLMOVE takes from the right (FIFO) and parks the item on the processing list in one atomic step
+        serialized_data = await R.blmove(queue_name, processing_queue, timeout, "RIGHT", "LEFT")
+        
+        if serialized_data is None:
+            return None
+        
+        try:
+            return model_class.model_validate_json(serialized_data), serialized_data
+        except Exception:
+            # An item that can't be deserialized would fail again on every retry
+            await R.lrem(processing_queue, 1, serialized_data)
+            raise
     except Exception as e:
         print(f"Error getting model from queue {queue_name}: {e}")
         return None
 
 
-def peek_from_queue(model_class: Type[T], queue_name: Optional[str] = None) -> Optional[T]:
+async def ack_from_queue(serialized_data: bytes, consumer_id: str, queue_name: Optional[str] = None,
+                         model_class: Optional[Type[T]] = None) -> bool:
+    """
+    Remove an item taken with get_from_queue_reliable from the consumer's processing list.
+    
+    Args:
+        serialized_data: The serialized item as returned by get_from_queue_reliable
+        consumer_id: Id of the consumer that took the item
+        queue_name: Optional custom queue name. If None, derived from model_class.
+        model_class: Optional model class to derive queue name from if queue_name is None.
+        
+    Returns:
+        bool: True if the item was removed, False otherwise
+    """
+    try:
+        # Auto-derive queue name from model class if not provided
+        if queue_name is None:
+            if model_class is None:
+                raise ValueError("Either queue_name or model_class must be provided")
+            queue_name = f"queue:{model_class.__name__.lower()}"
+        
+        return await R.lrem(processing_queue_name(queue_name, consumer_id), 1, serialized_data) > 0
+    except Exception as e:
+        print(f"Error acknowledging item from queue {queue_name}: {e}")
+        return False
+
+
+async def requeue_stale_processing(model_class: Type[T], queue_name: Optional[str] = None) -> list[T]:
+    """
+    Move the unacknowledged items of every consumer whose heartbeat has expired back to the front of the queue.
+    The items of consumers that are still alive are left alone.
+    
+    Args:
+        model_class: The class of the BaseModel to deserialize
+        queue_name: Optional custom queue name. If None, derived from model class name.
+        
+    Returns:
+        list[T]: The requeued model instances, oldest first per consumer; empty if there were none or an error occurs
+    """
+    try:
+        # Auto-derive queue name from model class if not provided
+        if queue_name is None:
+            queue_name = f"queue:{model_class.__name__.lower()}"
+        
+        consumer_ids = [consumer_id.decode("utf-8") for consumer_id in await R.smembers(consumers_key(queue_name))]
+        async with R.pipeline(transaction=False) as pipe:
+            for consumer_id in consumer_ids:
+                pipe.exists(heartbeat_key(queue_name, consumer_id))
+            alive = await pipe.execute()
+        
+        requeued_models = []
+        for consumer_id, is_alive in zip(consumer_ids, alive):
+            if is_alive:
+                continue
+            # Newest first from the processing list onto the consuming (right) end, so the oldest is taken next.
+            # LMOVE is atomic, so consumers recovering the same list concurrently never requeue an item twice
+            processing_queue = processing_queue_name(queue_name, consumer_id)
+            requeued = []
+            while (serialized_data := await R.lmove(processing_queue, queue_name, "LEFT", "RIGHT")) is not None:
+                requeued.append(serialized_data)
+            await R.srem(consumers_key(queue_name), consumer_id)
+            requeued_models.extend(model_class.model_validate_json(serialized_data) for serialized_data in reversed(requeued))
+        
+        return requeued_models
+    except Exception as e:
+        print(f"Error requeueing processing items for queue {queue_name}: {e}")
+        return []
+
+
+async def get_many_from_queue(model_class: Type[T], count: int, queue_name: Optional[str] = None) -> list[T]:
+    """
+    Get up to `count` BaseModel instances from a queue in Redis in one round trip.
+    
+    Args:
+        model_class: The class of the BaseModel to deserialize
+        count: Maximum number of items to take
+        queue_name: Optional custom queue name. If None, derived from model class name.
+        
+    Returns:
+        list[T]: The deserialized model instances in queue order; empty if the queue is empty or an error occurs
+    """
+    try:
+        # Auto-derive queue name from model class if not provided
+        if queue_name is None:
+            queue_name = f"queue:{model_class.__name__.lower()}"
+        
+        # MULTI/EXEC so no other consumer takes items from the middle of the batch
+        async with R.pipeline(transaction=True) as pipe:
+            for _ in range(count):
+                pipe.rpop(queue_name)
+            serialized_items = await pipe.execute()
+        
+        # The items are JSON objects, so the batch is validated as one JSON array in a single pydantic-core call
+        try:
+            return validate_many(model_class, serialized_items)
+        except ValueError:
+            pass
+        
+        # Some item is malformed; the batch is already off the queue, so keep every item that does validate
+        models = []
+        for serialized_data in serialized_items:
+            if serialized_data is None:
+                continue
+            try:
+                models.append(model_class.model_validate_json(serialized_data))
+            except ValueError as e:
+                print(f"Dropping malformed item from queue {queue_name}: {e}")
+        return models
+    except Exception as e:
+        print(f"Error getting models from queue {queue_name}: {e}")
+        return []
+
+
+async def peek_from_queue(model_class: Type[T], queue_name: Optional[str] = None) -> Optional[T]:
     """
     Peek at a BaseModel instance from a queue without removing it.
     
@@ -86,22 +330,19 @@ def peek_from_queue(model_class: Type[T], queue_name: Optional[str] = None) -> O
             queue_name = f"queue:{model_class.__name__.lower()}"
         
         # Get item from Redis list without removing it
-        serialized_data = R.lindex(queue_name, -1)  # Get the rightmost item
+        serialized_data = await R.lindex(queue_name, -1)  # Get the rightmost item
         
         if serialized_data is None:
             return None
             
-        # Deserialize the JSON data
-        data = orjson.loads(serialized_data)
-        
-        # Create model instance
-        return model_class(**data)
+        # Deserialize and validate the JSON data in one step
+        return model_class.model_validate_json(serialized_data)
     except Exception as e:
         print(f"Error peeking model from queue {queue_name}: {e}")
         return None
 
 
-def queue_length(queue_name: Optional[str] = None, model_class: Optional[Type[T]] = None) -> int:
+async def queue_length(queue_name: Optional[str] = None, model_class: Optional[Type[T]] = None) -> int:
     """
     Get the length of a queue.
     
@@ -119,13 +360,33 @@ def queue_length(queue_name: Optional[str] = None, model_class: Optional[Type[T]
                 raise ValueError("Either queue_name or model_class must be provided")
             queue_name = f"queue:{model_class.__name__.lower()}"
         
-        return R.llen(queue_name)
+        return await R.llen(queue_name)
     except Exception as e:
         print(f"Error getting queue length for {queue_name}: {e}")
         return 0
 
 
-def clear_queue(queue_name: Optional[str] = None, model_class: Optional[Type[T]] = None) -> bool:
+async def queue_lengths(model_classes: list[Type[T]]) -> dict[Type[T], int]:
+    """
+    Get the lengths of the queues of several model classes in one pipelined round trip.
+    
+    Args:
+        model_classes: Model classes to derive the queue names from.
+        
+    Returns:
+        dict: The number of items in each model class's queue
+    """
+    try:
+        async with R.pipeline(transaction=False) as pipe:
+            for model_class in model_classes:
+                pipe.llen(f"queue:{model_class.__name__.lower()}")
+            return dict(zip(model_classes, await pipe.execute()))
+    except Exception as e:
+        print(f"Error getting queue lengths: {e}")
+        return {}
+
+
+async def clear_queue(queue_name: Optional[str] = None, model_class: Optional[Type[T]] = None) -> bool:
     """
     Clear all items from a queue.
     
@@ -143,7 +404,7 @@ def clear_queue(queue_name: Optional[str] = None, model_class: Optional[Type[T]]
                 raise ValueError("Either queue_name or model_class must be provided")
             queue_name = f"queue:{model_class.__name__.lower()}"
         
-        R.delete(queue_name)
+        await R.delete(queue_name)
         return True
     except Exception as e:
         print(f"Error clearing queue {queue_name}: {e}")
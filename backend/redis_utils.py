@@ -1,4 +1,5 @@
 import redis
+import redis.asyncio
 import os
 
 
@@ -9,4 +10,33 @@ def get_redis(url: str = None) -> redis.Redis:
     return redis.Redis.from_url(url, decode_responses=False)
 
 
+# Shared by every async client in the process (db, redis_queue) so connections are reused across modules
+_async_pool: redis.asyncio.BlockingConnectionPool | None = None
+
+
+def get_async_pool() -> redis.asyncio.BlockingConnectionPool:
+    global _async_pool
+    if _async_pool is None:
+        # Blocking: when every connection is busy, callers wait for one instead of erroring
+        _async_pool = redis.asyncio.BlockingConnectionPool.from_url(
+            os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", 64)),
+            timeout=int(os.getenv("REDIS_POOL_TIMEOUT", 20)),
+            decode_responses=False,
+        )
+    return _async_pool
+
+
+def get_async_redis(url: str = None) -> redis.asyncio.Redis:
+    if url is None:
+        return redis.asyncio.Redis(connection_pool=get_async_pool())
+    return redis.asyncio.Redis.from_url(url, decode_responses=False)
+
+
+async def close_async_pool() -> None:
+    """Close the shared async pool's connections, e.g. on application shutdown"""
+    if _async_pool is not None:
+        await _async_pool.disconnect()
+
+
 R = get_redis()
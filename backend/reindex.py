@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Rebuild the secondary Redis indexes from the stored models.
+
+The indexes are kept up to date by db.save/db.delete; run this once for data
+written before an index existed, or if an index is suspected to be out of sync.
+The API backfills them on startup if they were never built (see ensure_indexes).
+"""
+
+import asyncio
+
+from db import (R, INDEXED_MODELS, INDEXES_BUILT_KEY, SCAN_BATCH_SIZE, STORED_MODELS, add_to_indexes, clear_indexes,
+                ids_key, key, scan, scan_keys, validate_many)
+
+
+async def reindex() -> None:
+    # The id sets come first: scan() reads the stored models through them
+    for cls in STORED_MODELS:
+        prefix = key(cls, "")
+        ids = [k.decode("utf-8")[len(prefix):] for k in await scan_keys(key(cls, "*"))]
+        async with R.pipeline(transaction=True) as pipe:
+            pipe.delete(ids_key(cls))
+            if ids:
+                pipe.sadd(ids_key(cls), *ids)
+            await pipe.execute()
+        print(f"Rebuilt the id set of {len(ids)} {cls.__name__} objects")
+
+    for cls in INDEXED_MODELS:
+        await clear_indexes(cls)
+        models = await scan(cls)
+        async with R.pipeline(transaction=False) as pipe:
+            for model in models:
+                add_to_indexes(pipe, model)
+            await pipe.execute()
+        print(f"Indexed {len(models)} {cls.__name__} objects")
+    await R.set(INDEXES_BUILT_KEY, 1)
+
+
+async def ensure_indexes() -> bool:
+    """Backfill the id sets and indexes if they were never built, e.g. for data written by an older version.
+    Only adds entries, so it is safe while workers are writing. Returns whether a backfill ran."""
+    if await R.exists(INDEXES_BUILT_KEY):
+        return False
+    for cls in STORED_MODELS:
+        prefix = key(cls, "")
+        keys = await scan_keys(key(cls, "*"))
+        for i in range(0, len(keys), SCAN_BATCH_SIZE):
+            batch = keys[i:i + SCAN_BATCH_SIZE]
+            async with R.pipeline(transaction=False) as pipe:
+                pipe.sadd(ids_key(cls), *(k.decode("utf-8")[len(prefix):] for k in batch))
+                if issubclass(cls, INDEXED_MODELS):
+                    for model in validate_many(cls, await R.mget(batch)):
+                        add_to_indexes(pipe, model)
+                await pipe.execute()
+        print(f"Backfilled the id set and indexes of {len(keys)} {cls.__name__} objects")
+    await R.set(INDEXES_BUILT_KEY, 1)
+    return True
+
+
+if __name__ == "__main__":
+    asyncio.run(reindex())
@@ -17,6 +17,7 @@ def main():
         print("  parsing-worker         - Run the parsing worker")
         print("  parser-generation-worker - Run the parser generation worker")
         print("  evaluation             - Run evaluation")
+        print("  reindex                - Rebuild the secondary Redis indexes")
         print("  test_sample_urls       - Run test sample URLs script")
         print("  test_paths             - Test path resolution")
         print("  <script_name>.py       - Run any .py file directly")
@@ -35,6 +36,7 @@ def main():
         "parsing-worker": "workers/parsing_worker.py",
         "parser-generation-worker": "workers/parser_generation_worker.py",
         "evaluation": "evaluation.py",
+        "reindex": "reindex.py",
         "test_sample_urls": "test_sample_urls.py",
         "test_paths": "test_paths.py",
     }
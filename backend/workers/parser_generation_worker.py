@@ -4,38 +4,54 @@ Parser Generation Worker - Generates new parsers using AI for URLPrefix objects
 """
 
 import os
+import socket
 import logging
 import asyncio
+import uuid
 
 from parser import ParserGenerator
 from data_models import URLPrefix, ParserGeneratorConfig
 from redis_utils import get_redis
-from redis_queue import get_from_queue
-from db import get_production_config, save, is_system_running
+from redis_queue import get_from_queue_reliable, ack_from_queue, heartbeat, requeue_stale_processing
+from db import get_production_config, save, update_if, is_system_running, wait_for_system_running
+from paths import CONFIGS_PATH
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# How long one blocking queue read waits before the loop re-checks the system state
+QUEUE_WAIT_SECONDS = 5
+# How long a paused worker waits for a resume notification before re-checking the system state itself
+PAUSE_WAIT_SECONDS = 30
+# A worker refreshes its heartbeat this often; once it has missed it for HEARTBEAT_TTL_SECONDS,
+# another worker puts the job it was handling back on the queue
+HEARTBEAT_INTERVAL_SECONDS = 15
+HEARTBEAT_TTL_SECONDS = 60
+
 
 class ParserGenerationWorker:
     def __init__(self, redis_url: str = "redis://localhost:6379/0"):
         self.redis_client = get_redis(redis_url)
+        # Identifies this worker's processing list. A restarted container keeps its hostname and pid,
+        # so a random part keeps the new process from taking over the list of the one that stopped
+        self.consumer_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # config name -> (file mtime, config); a config file is only reparsed when it changes
+        self._config_cache: dict[str, tuple[int, ParserGeneratorConfig]] = {}
         
     async def get_production_generator_config(self) -> ParserGeneratorConfig:
         """Get the current production parser generator config"""
-        config_name = get_production_config()
+        config_name = await get_production_config()
         if not config_name:
             raise ValueError("No production config set")
         
         logger.info(f"Using production config: {config_name}")
-        return ParserGeneratorConfig.from_config(config_name)
-    
-    def reset_failed_url_prefix(self, url_prefix: URLPrefix) -> None:
-        """Reset a failed URLPrefix to None status for retry"""
-        url_prefix.processing_status = None
-        save(url_prefix)
-        logger.info(f"Reset URLPrefix {url_prefix.prefix} from failed to None status")
+        mtime = (CONFIGS_PATH / f"{config_name}.yaml").stat().st_mtime_ns
+        cached = self._config_cache.get(config_name)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, ParserGeneratorConfig.from_config(config_name))
+            self._config_cache[config_name] = cached
+        return cached[1]
     
     async def generate_parser_for_url_prefix(self, url_prefix: URLPrefix) -> URLPrefix:
         """Generate a parser config for a URLPrefix and update the object"""
@@ -49,7 +65,7 @@ class ParserGenerationWorker:
             parser_generator = ParserGenerator(generator_config)
             
             # Generate the parser
-            parser = parser_generator.generate_parser(url_prefix)
+            parser = await parser_generator.generate_parser_async(url_prefix)
             
             # Update the URLPrefix with the generated parser config
             url_prefix.parser_config = parser.config
@@ -68,39 +84,32 @@ class ParserGenerationWorker:
         try:
             logger.info(f"Processing URLPrefix job: {url_prefix.prefix}")
             
-            # Check if this URLPrefix is already being processed
-            from db import load
-            existing_prefix = load(URLPrefix, url_prefix.prefix)
-            if existing_prefix:
-                # Handle backward compatibility - if processing_status doesn't exist, set it to None
-                if not hasattr(existing_prefix, 'processing_status'):
-                    existing_prefix.processing_status = None
-                    save(existing_prefix)
-                
-                if existing_prefix.processing_status == "in_progress":
-                    logger.info(f"URLPrefix {url_prefix.prefix} is already being processed, skipping")
-                    return {
-                        "status": "skipped",
-                        "url_prefix_id": url_prefix.prefix,
-                        "reason": "already in progress"
-                    }
-                elif existing_prefix.processing_status == "failed":
-                    logger.info(f"URLPrefix {url_prefix.prefix} was previously failed, resetting to None")
-                    self.reset_failed_url_prefix(existing_prefix)
-                    # Use the existing prefix with reset status
-                    url_prefix = existing_prefix
-            
-            # Mark as in progress and save
-            url_prefix.processing_status = "in_progress"
-            save(url_prefix)
+            def claim(existing_prefix: URLPrefix | None) -> URLPrefix | None:
+                if existing_prefix and existing_prefix.processing_status == "in_progress":
+                    return None
+                # A previously failed URLPrefix is retried from its stored copy
+                claimed = existing_prefix if existing_prefix and existing_prefix.processing_status == "failed" else url_prefix
+                claimed.processing_status = "in_progress"
+                return claimed
+            
+            # Check the stored status and mark as in progress in one compare-and-set, so two workers can't both take it
+            claimed_prefix = await update_if(URLPrefix, url_prefix.prefix, claim)
+            if claimed_prefix is None:
+                logger.info(f"URLPrefix {url_prefix.prefix} is already being processed, skipping")
+                return {
+                    "status": "skipped",
+                    "url_prefix_id": url_prefix.prefix,
+                    "reason": "already in progress"
+                }
+            url_prefix = claimed_prefix
             logger.info(f"Marked URLPrefix {url_prefix.prefix} as in progress")
             
             # Generate parser for the URL prefix
             updated_url_prefix = await self.generate_parser_for_url_prefix(url_prefix)
             
-            # Mark as completed and save the updated URLPrefix to the database
+            # Mark as completed and save the status together with the new parser config in one write
             updated_url_prefix.processing_status = "completed"
-            save(updated_url_prefix)
+            await save(updated_url_prefix)
             
             logger.info(f"Successfully saved updated URLPrefix: {url_prefix.prefix}")
             
@@ -116,7 +125,7 @@ class ParserGenerationWorker:
             # Mark as failed and save
             try:
                 url_prefix.processing_status = "failed"
-                save(url_prefix)
+                await save(url_prefix)
                 logger.info(f"Marked URLPrefix {url_prefix.prefix} as failed")
             except Exception as save_error:
                 logger.error(f"Failed to save failed status for {url_prefix.prefix}: {save_error}")
@@ -127,32 +136,64 @@ class ParserGenerationWorker:
                 "error": str(e)
             }
     
+    async def recover_unfinished_jobs(self) -> None:
+        """Put jobs that were taken but never finished back on the queue, for workers whose heartbeat has expired
+        (they stopped mid-job). Jobs of workers that are still running are left alone."""
+        def release(existing_prefix: URLPrefix | None) -> URLPrefix | None:
+            # Clear the stale claim so process_url_prefix_job doesn't skip the job as already in progress
+            if existing_prefix and existing_prefix.processing_status == "in_progress":
+                existing_prefix.processing_status = None
+                return existing_prefix
+            return None
+        
+        for url_prefix in await requeue_stale_processing(URLPrefix):
+            await update_if(URLPrefix, url_prefix.prefix, release)
+            logger.info(f"Requeued unfinished URLPrefix job: {url_prefix.prefix}")
+    
+    async def keep_alive(self) -> None:
+        """Refresh this worker's heartbeat and recover the jobs of workers that stopped, until cancelled"""
+        while True:
+            try:
+                await heartbeat(self.consumer_id, HEARTBEAT_TTL_SECONDS, model_class=URLPrefix)
+                await self.recover_unfinished_jobs()
+            except Exception as e:
+                logger.error(f"Error in worker heartbeat: {e}")
+            await asyncio.sleep(HEARTBEAT_INTERVAL_SECONDS)
+    
     async def run(self):
         """Main worker loop - continuously process URLPrefix objects from queue"""
         logger.info("Starting parser generation worker...")
+        keep_alive_task = asyncio.create_task(self.keep_alive())
         
+        try:
+            await self._run_loop()
+        finally:
+            keep_alive_task.cancel()
+    
+    async def _run_loop(self):
+        """Take and process URLPrefix jobs until interrupted"""
         while True:
             try:
                 # Check system state before processing
-                if not is_system_running():
+                if not await is_system_running():
                     logger.info("System is paused, waiting...")
-                    await asyncio.sleep(5)  # Wait longer when paused
+                    # Woken as soon as the system is resumed; the timeout is only a fallback re-check
+                    await wait_for_system_running(PAUSE_WAIT_SECONDS)
                     continue
                 
-                # Get URLPrefix from queue using exa_queue functionality
-                url_prefix = get_from_queue(URLPrefix)
+                # Wait on the queue for the next URLPrefix; the timeout brings the loop back to the pause check.
+                # The job stays on the processing list until it's handled, so a crash doesn't lose it
+                taken = await get_from_queue_reliable(URLPrefix, self.consumer_id, timeout=QUEUE_WAIT_SECONDS)
                 
-                if url_prefix is None:
-                    # No URLPrefix available, wait a bit before checking again
-                    await asyncio.sleep(1)
+                if taken is None:
                     continue
+                url_prefix, serialized_job = taken
                 
                 logger.info(f"Retrieved URLPrefix from queue: {url_prefix.prefix}")
                 
-                # Process the URLPrefix job
+                # Process the URLPrefix job; its outcome (including failure) is saved, so it can be acknowledged
                 result = await self.process_url_prefix_job(url_prefix)
-
-                await asyncio.sleep(1)
+                await ack_from_queue(serialized_job, self.consumer_id, model_class=URLPrefix)
                 
                 if result["status"] == "success":
                     logger.info(f"Successfully processed URLPrefix: {url_prefix.prefix}")
@@ -4,171 +4,281 @@ Parsing Worker - Processes URLQueueItems using existing parsers
 """
 
 import os
+import re
 import logging
 import asyncio
 import time
-from typing import List
+from typing import List, Optional, Tuple
+from functools import lru_cache
 from urllib.parse import urljoin, urlparse
-from bs4 import BeautifulSoup
+import lxml.html
+from lxml import etree
 
 from parser import Parser
 from data_models import SampleURL, URLQueueItem, URLPrefix, URL
 from redis_utils import get_redis
-from redis_queue import get_from_queue, add_to_queue
-from db import find_prefix_for_url, save, load, is_system_running, find_urls_with_prefix
-from load_html import load_raw_html
+from redis_queue import get_many_from_queue, add_to_queue, add_many_to_queue, add_to_queues
+from db import find_prefix_for_url, save, load, load_many, update_if, is_system_running, count_urls_with_prefix
+from load_html import load_raw_html_async
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# How many URLQueueItems the worker takes from the queue and processes concurrently
+PREFETCH = int(os.getenv("PARSING_WORKER_PREFETCH", 16))
+# Wait before re-checking an empty queue; doubles while it stays empty
+IDLE_WAIT_MIN_SECONDS = 0.05
+IDLE_WAIT_MAX_SECONDS = 1.0
+
+# Link extraction only needs the href of every anchor, read straight off lxml's C parser
+_LINK_HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+_ANCHOR_HREFS = etree.XPath("//a/@href", smart_strings=False)
+
+
+# Query parameters that normalize_url removes
+TRACKING_PARAMS = frozenset({
+    'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content',
+    'fbclid', 'gclid', 'msclkid', 'ref', 'source', 'campaign',
+    'sessionid', 'sid', 'token', 'auth', 'key'
+})
+
+
+# Characters that make urlparse split off more than scheme, netloc, path and query, or validate the host
+_URLPARSE_SPECIAL_RE = re.compile(r"[#;\[\]]")
+
+
+# URLs normalize_url would return unchanged: lowercase http(s) host without www. or a port, and a path of
+# printable ASCII without a trailing slash (other than the root) and nothing urlparse treats specially.
+# Most links on a page are already like this.
+_PATH_CHAR = r"[^\x00-\x20\x7f-\U0010ffff?#;\[\]]"
+_PATH_END_CHAR = r"[^\x00-\x20\x7f-\U0010ffff?#;\[\]/]"
+_NORMALIZED_URL_RE = re.compile(rf"https?://(?!www\.)[a-z0-9.\-]+(?:/(?:{_PATH_CHAR}*{_PATH_END_CHAR})?)?")
+
+
+def _split_http_url(url: str) -> Optional[Tuple[str, str, str, str]]:
+    """(scheme, netloc, path, query) of a plain http(s) URL, found with a few str.find calls.
+    None for anything urlparse treats specially (fragments, ;params, IPv6 hosts, non-ASCII, control
+    characters), which is then left to urlparse."""
+    if url.startswith("https://"):
+        scheme, netloc_start = "https", 8
+    elif url.startswith("http://"):
+        scheme, netloc_start = "http", 7
+    else:
+        return None
+    if not (url.isascii() and url.isprintable()) or _URLPARSE_SPECIAL_RE.search(url):
+        return None
+    query_start = url.find("?", netloc_start)
+    if query_start == -1:
+        query_start = len(url)
+    path_start = url.find("/", netloc_start, query_start)
+    if path_start == -1:
+        path_start = query_start
+    return scheme, url[netloc_start:path_start], url[path_start:query_start], url[query_start + 1:]
+
+
+# Pages link to the same URLs over and over (navigation, footers), so normalized URLs are memoized
+@lru_cache(maxsize=4096)
+def normalize_url(url: str) -> str:
+    """Normalize URL by removing tracking parameters, normalizing trailing slashes, and www subdomain"""
+    if _NORMALIZED_URL_RE.fullmatch(url):
+        return url
+    try:
+        # Split the URL; plain http(s) URLs (nearly every link) skip urlparse
+        parts = _split_http_url(url)
+        if parts is None:
+            parsed = urlparse(url)
+            parts = (parsed.scheme, parsed.netloc, parsed.path, parsed.query)
+        scheme, netloc, path, query = parts
+        
+        # Normalize scheme to lowercase
+        scheme = scheme.lower()
+        
+        # Normalize netloc (domain and port)
+        netloc = netloc.lower()
+        
+        # Remove www. prefix if present
+        if netloc.startswith('www.'):
+            netloc = netloc[4:]
+        
+        # Remove default ports
+        if scheme == 'https' and ':443' in netloc:
+            netloc = netloc.replace(':443', '')
+        elif scheme == 'http' and ':80' in netloc:
+            netloc = netloc.replace(':80', '')
+        
+        # Remove trailing slash unless it's the root path
+        if path != '/' and path.endswith('/'):
+            path = path[:-1]
+        
+        # Normalize query parameters: keep the original name=value pairs as written, minus tracking
+        # parameters and empty values, sorted for consistency
+        query_params = []
+        if query:
+            for pair in query.split('&'):
+                key, eq, value = pair.partition('=')
+                if eq and value.strip() and key.lower() not in TRACKING_PARAMS:
+                    query_params.append(pair)
+            query_params.sort()
+        
+        # Reconstruct the URL
+        normalized_url = f"{scheme}://{netloc}{path}"
+        if query_params:
+            normalized_url += "?" + "&".join(query_params)
+        
+        return normalized_url
+        
+    except Exception as e:
+        logger.debug(f"Failed to normalize URL {url}: {e}")
+        return url
+
+
+# In-process caches for the two lookups made for every queue item. Only prefixes that already have a
+# parser are cached: those rarely change, while a prefix still waiting for its parser is looked up fresh
+# so the new parser is picked up right away. A cached URL count is raised as soon as this worker takes
+# on a URL for the prefix, so items processed concurrently can't all pass the limit on the same count;
+# saves from other workers show up once the TTL runs out.
+PREFIX_CACHE_TTL_SECONDS = 30.0
+PREFIX_CACHE_MAX_SIZE = 10_000
+PARSER_CACHE_MAX_SIZE = 1024
+_prefix_cache: dict[str, tuple[float, URLPrefix]] = {}
+_prefix_count_cache: dict[str, tuple[float, int]] = {}
+
+
+def _cache_put(cache: dict, key: str, value) -> None:
+    if len(cache) >= PREFIX_CACHE_MAX_SIZE:
+        del cache[next(iter(cache))]  # oldest entry
+    cache[key] = (time.monotonic(), value)
+
+
+def _cache_get(cache: dict, key: str):
+    cached = cache.get(key)
+    if cached is not None and time.monotonic() - cached[0] < PREFIX_CACHE_TTL_SECONDS:
+        return cached[1]
+    return None
+
+
+async def _cached_find_prefix(url: str) -> URLPrefix | None:
+    url_prefix = _cache_get(_prefix_cache, url)
+    if url_prefix is None:
+        url_prefix = await find_prefix_for_url(url)
+        if url_prefix is not None and url_prefix.parser_config:
+            _cache_put(_prefix_cache, url, url_prefix)
+    return url_prefix
+
+
+async def _cached_prefix_count(prefix: str) -> int:
+    url_count = _cache_get(_prefix_count_cache, prefix)
+    if url_count is None:
+        url_count = await count_urls_with_prefix(prefix)
+        # Another item may have filled (and raised) the entry while this one waited
+        cached_count = _cache_get(_prefix_count_cache, prefix)
+        if cached_count is None:
+            _cache_put(_prefix_count_cache, prefix, url_count)
+        else:
+            url_count = cached_count
+    return url_count
+
+
+def _count_prefix_url(prefix: str, delta: int = 1) -> None:
+    """Count a URL this worker is about to save under `prefix` in the cached count (delta=-1 takes it back)"""
+    cached = _prefix_count_cache.get(prefix)
+    if cached is not None:
+        _prefix_count_cache[prefix] = (cached[0], cached[1] + delta)
+
 
 class ParsingWorker:
     def __init__(self, redis_url: str = "redis://localhost:6379/0"):
         self.redis_client = get_redis(redis_url)
+        # prefix -> Parser for its current parser config, reused across that prefix's URLs
+        self._parser_cache: dict[str, Parser] = {}
+    
+    def get_parser(self, url_prefix: URLPrefix) -> Parser:
+        """Parser for a URLPrefix's parser config; rebuilt only when the config has changed"""
+        parser = self._parser_cache.get(url_prefix.prefix)
+        if parser is None or parser.config != url_prefix.parser_config:
+            if len(self._parser_cache) >= PARSER_CACHE_MAX_SIZE:
+                del self._parser_cache[next(iter(self._parser_cache))]  # oldest entry
+            parser = self._parser_cache[url_prefix.prefix] = Parser(url_prefix.parser_config)
+        return parser
         
     def get_deepest_prefix(self, url: str) -> str:
         """Get the deepest prefix for a URL (e.g., https://example.com/path/ for https://example.com/path/page.html)"""
         # Remove query parameters and fragments
-        if '?' in url:
-            url = url.split('?')[0]
-        if '#' in url:
-            url = url.split('#')[0]
-            
-        # Split by '/' and remove the last segment if it's not empty
-        parts = url.split('/')
-        if len(parts) > 3:  # Has path beyond domain
-            # Remove the last non-empty part
-            while parts and not parts[-1]:
-                parts.pop()
-            if parts:
-                parts.pop()  # Remove the last segment
-            return '/'.join(parts)
-        else:
+        end = len(url)
+        for separator in '?#':
+            index = url.find(separator, 0, end)
+            if index != -1:
+                end = index
+        
+        if url.count('/', 0, end) < 3:
             # No path beyond domain, return the domain with trailing slash
-            return '/'.join(parts)
+            return url[:end]
+        
+        # Remove trailing slashes, then the last segment
+        while end and url[end - 1] == '/':
+            end -= 1
+        return url[:max(url.rfind('/', 0, end), 0)]
     
     def normalize_url(self, url: str) -> str:
         """Normalize URL by removing tracking parameters, normalizing trailing slashes, and www subdomain"""
-        try:
-            # Parse the URL
-            parsed = urlparse(url)
-            
-            # Normalize scheme to lowercase
-            scheme = parsed.scheme.lower()
-            
-            # Normalize netloc (domain and port)
-            netloc = parsed.netloc.lower()
-            
-            # Remove www. prefix if present
-            if netloc.startswith('www.'):
-                netloc = netloc[4:]
-            
-            # Remove default ports
-            if scheme == 'https' and ':443' in netloc:
-                netloc = netloc.replace(':443', '')
-            elif scheme == 'http' and ':80' in netloc:
-                netloc = netloc.replace(':80', '')
-            
-            # Normalize path
-            path = parsed.path
-            
-            # Remove trailing slash unless it's the root path
-            if path != '/' and path.endswith('/'):
-                path = path[:-1]
-            
-            # Normalize query parameters
-            query_params = []
-            if parsed.query:
-                from urllib.parse import parse_qs, urlencode
-                
-                # Parse query parameters
-                params = parse_qs(parsed.query)
-                
-                # List of tracking parameters to remove
-                tracking_params = {
-                    'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content',
-                    'fbclid', 'gclid', 'msclkid', 'ref', 'source', 'campaign',
-                    'sessionid', 'sid', 'token', 'auth', 'key'
-                }
-                
-                # Filter out tracking parameters and empty values
-                for key, values in params.items():
-                    if key.lower() not in tracking_params:
-                        # Keep non-empty values
-                        non_empty_values = [v for v in values if v.strip()]
-                        if non_empty_values:
-                            query_params.extend([(key, v) for v in non_empty_values])
-                
-                # Sort parameters for consistency
-                query_params.sort()
-            
-            # Reconstruct the URL
-            normalized_url = f"{scheme}://{netloc}{path}"
-            if query_params:
-                normalized_url += "?" + urlencode(query_params)
-            
-            return normalized_url
-            
-        except Exception as e:
-            logger.debug(f"Failed to normalize URL {url}: {e}")
-            return url
+        return normalize_url(url)
     
     def extract_links_from_html(self, html_content: str, base_url: str, target_prefix: str) -> List[str]:
         """Extract links from HTML content that share the same prefix"""
-        links = []
+        # Links in first-seen order, deduplicated as they are found
+        unique_links = []
+        seen = set()
         
         try:
-            # Parse HTML with BeautifulSoup
-            soup = BeautifulSoup(html_content, 'html.parser')
+            # Parse HTML with lxml
+            tree = lxml.html.document_fromstring(html_content.encode("utf-8", "replace"), parser=_LINK_HTML_PARSER)
+            
+            # Find the href of every anchor tag
+            hrefs = _ANCHOR_HREFS(tree)
             
-            # Find all anchor tags
-            anchor_tags = soup.find_all('a', href=True)
+            # Loop-invariant: the page's own URL, normalized once
+            normalized_base_url = self.normalize_url(base_url)
             
-            for anchor in anchor_tags:
-                href = anchor.get('href')
-                if not href:
+            # Hot loop: bind what it calls to locals, and handle each distinct href once
+            # (navigation and footer links repeat the same hrefs many times per page)
+            join = urljoin
+            normalize = self.normalize_url
+            seen_hrefs = set()
+            
+            for href in hrefs:
+                if not href or href in seen_hrefs:
                     continue
+                seen_hrefs.add(href)
                 
                 try:
                     # Resolve relative URLs to absolute URLs
-                    absolute_url = urljoin(base_url, href)
+                    absolute_url = join(base_url, href)
                     
                     # Remove anchor (fragment identifier) from URL
                     if '#' in absolute_url:
                         absolute_url = absolute_url.split('#')[0]
                     
                     # Normalize the URL
-                    normalized_url = self.normalize_url(absolute_url)
-                    
-                    # Parse the URL to normalize it
-                    parsed_url = urlparse(normalized_url)
+                    normalized_url = normalize(absolute_url)
                     
-                    # Skip if it's not an HTTP/HTTPS URL
-                    if parsed_url.scheme not in ['http', 'https']:
+                    # Skip if it's not an HTTP/HTTPS URL (normalize_url lowercases the scheme, so a prefix check will do)
+                    if not normalized_url.startswith(('http://', 'https://')):
                         continue
                     
                     # Skip if it's the same as the base URL (after normalization)
-                    normalized_base_url = self.normalize_url(base_url)
                     if normalized_url == normalized_base_url:
                         continue
                     
                     # Check if the URL shares the same prefix
-                    if normalized_url.startswith(target_prefix):
-                        links.append(normalized_url)
+                    if normalized_url.startswith(target_prefix) and normalized_url not in seen:
+                        seen.add(normalized_url)
+                        unique_links.append(normalized_url)
                         
                 except Exception as e:
                     logger.debug(f"Failed to process link {href}: {e}")
                     continue
             
-            # Remove duplicates while preserving order
-            unique_links = []
-            seen = set()
-            for link in links:
-                if link not in seen:
-                    unique_links.append(link)
-                    seen.add(link)
-            
             return unique_links
             
         except Exception as e:
@@ -185,7 +295,7 @@ class ParsingWorker:
             if current_time < queue_item.process_from_unix_timestamp:
                 # logger.info(f"URL {queue_item.url.url} not ready for processing yet. Current time: {current_time}, required: {queue_item.process_from_unix_timestamp}")
                 # Put it back on the queue without incrementing times_queued
-                add_to_queue(queue_item)
+                await add_to_queue(queue_item)
                 return {
                     "status": "deferred",
                     "url": queue_item.url.url,
@@ -193,13 +303,12 @@ class ParsingWorker:
                 }
             
             # Check if there's a URL prefix for this URL
-            url_prefix = find_prefix_for_url(queue_item.url.url)
+            url_prefix = await _cached_find_prefix(queue_item.url.url)
             
             # If we have a prefix, check if we've already exceeded the URL limit
             if url_prefix:
                 # Count existing URLs for this prefix
-                existing_urls = find_urls_with_prefix(url_prefix.prefix)
-                url_count = len(existing_urls)
+                url_count = await _cached_prefix_count(url_prefix.prefix)
                 
                 # If we already have 20 or more URLs for this prefix, drop this URL from the queue
                 if url_count >= 20:
@@ -211,12 +320,15 @@ class ParsingWorker:
                     }
             
             if url_prefix and url_prefix.parser_config:
+                # No await since the limit check, so concurrent items see this URL counted
+                _count_prefix_url(url_prefix.prefix)
                 logger.info(f"Found existing parser for URL: {queue_item.url.url}")
                 
                 # Check if URL already exists in database
-                existing_url = load(URL, queue_item.url.url)
+                existing_url = await load(URL, queue_item.url.url)
                 if existing_url and existing_url.parsed_content:
                     logger.info(f"URL {queue_item.url.url} already exists and has been parsed, skipping")
+                    _count_prefix_url(url_prefix.prefix, -1)
                     return {
                         "status": "skipped",
                         "url": queue_item.url.url,
@@ -225,10 +337,11 @@ class ParsingWorker:
                 
                 # Load raw HTML content
                 try:
-                    raw_content = load_raw_html(queue_item.url.url)
+                    raw_content = await load_raw_html_async(queue_item.url.url)
                     queue_item.url.raw_content = raw_content
                 except Exception as e:
                     logger.error(f"Failed to load HTML for {queue_item.url.url}: {e}")
+                    _count_prefix_url(url_prefix.prefix, -1)
                     return {
                         "status": "error",
                         "url": queue_item.url.url,
@@ -237,12 +350,14 @@ class ParsingWorker:
                 
                 # Parse content using existing parser
                 try:
-                    parser = Parser(url_prefix.parser_config)
-                    parsed_content = parser.parse(raw_content)
+                    parser = self.get_parser(url_prefix)
+                    # Parsing is CPU-bound: run it on a worker thread so the batch's fetches and Redis calls keep going
+                    parsed_content = await asyncio.to_thread(parser.parse, raw_content)
                     queue_item.url.parsed_content = parsed_content
                     queue_item.url.prefix = url_prefix.prefix
                 except Exception as e:
                     logger.error(f"Failed to parse content for {queue_item.url.url}: {e}")
+                    _count_prefix_url(url_prefix.prefix, -1)
                     return {
                         "status": "error",
                         "url": queue_item.url.url,
@@ -250,16 +365,20 @@ class ParsingWorker:
                     }
                 
                 # Save the updated URL object
-                save(queue_item.url)
+                await save(queue_item.url)
                 
                 # Extract links from HTML that share the same prefix and add them to the queue
                 try:
-                    links_with_prefix = self.extract_links_from_html(raw_content, queue_item.url.url, url_prefix.prefix)
-                    added_to_queue = 0
+                    links_with_prefix = await asyncio.to_thread(
+                        self.extract_links_from_html, raw_content, queue_item.url.url, url_prefix.prefix
+                    )
+                    
+                    # Look up every link in one MGET instead of a round trip per link
+                    existing_link_urls = await load_many(URL, links_with_prefix)
                     
-                    for link_url in links_with_prefix:
+                    new_queue_items = []
+                    for link_url, existing_link_url in zip(links_with_prefix, existing_link_urls):
                         # Skip if this URL already exists and has been parsed
-                        existing_link_url = load(URL, link_url)
                         if existing_link_url and existing_link_url.parsed_content:
                             continue
                             
@@ -267,18 +386,17 @@ class ParsingWorker:
                         url_obj = URL(url=link_url, prefix=url_prefix.prefix)
                         
                         # Create URLQueueItem for this URL
-                        url_queue_item = URLQueueItem(
+                        new_queue_items.append(URLQueueItem(
                             url=url_obj,
                             process_from_unix_timestamp=int(time.time()),
                             times_queued=0
-                        )
-                        
-                        # Add to queue
-                        if add_to_queue(url_queue_item):
-                            added_to_queue += 1
-                            logger.info(f"Added URL with shared prefix to queue: {link_url}")
+                        ))
                     
+                    # Add them all to the queue in one round trip
+                    added_to_queue = await add_many_to_queue(new_queue_items)
                     if added_to_queue > 0:
+                        for url_queue_item in new_queue_items:
+                            logger.info(f"Added URL with shared prefix to queue: {url_queue_item.url.url}")
                         logger.info(f"Added {added_to_queue} URLs with shared prefix to queue")
                         
                 except Exception as e:
@@ -302,27 +420,24 @@ class ParsingWorker:
                 
                 # Create a new URLPrefix with the URL as a sample
                 try:
-                    raw_content = load_raw_html(queue_item.url.url)
+                    raw_content = await load_raw_html_async(queue_item.url.url)
                     sample_url = SampleURL(url=queue_item.url.url, raw_content=raw_content)
                     
-                    # Check if URLPrefix already exists
-                    existing_prefix = load(URLPrefix, deepest_prefix)
-                    if existing_prefix:
-                        # Add the sample URL to existing prefix
-                        existing_prefix.sample_urls.append(sample_url)
-                        save(existing_prefix)
-                        logger.info(f"Added sample URL to existing prefix: {deepest_prefix}")
-                    else:
+                    def add_sample(existing_prefix: URLPrefix | None) -> URLPrefix:
+                        if existing_prefix:
+                            # Add the sample URL to existing prefix
+                            existing_prefix.sample_urls.append(sample_url)
+                            return existing_prefix
                         # Create new URLPrefix
-                        new_prefix = URLPrefix(
+                        return URLPrefix(
                             prefix=deepest_prefix,
                             sample_urls=[sample_url]
                         )
-                        save(new_prefix)
-                        logger.info(f"Created new URLPrefix: {deepest_prefix}")
                     
-                    # Add the URLPrefix to the parser generation queue
-                    add_to_queue(new_prefix if not existing_prefix else existing_prefix)
+                    # Append in one compare-and-set, so items for the same prefix processed concurrently
+                    # don't overwrite each other's samples
+                    prefix_obj = await update_if(URLPrefix, deepest_prefix, add_sample)
+                    logger.info(f"Added sample URL to URLPrefix: {deepest_prefix} ({len(prefix_obj.sample_urls)} samples)")
                     
                 except Exception as e:
                     logger.error(f"Failed to create URLPrefix for {queue_item.url.url}: {e}")
@@ -335,7 +450,9 @@ class ParsingWorker:
                 # Put the URLQueueItem back on the queue with updated timestamp and incremented counter
                 queue_item.process_from_unix_timestamp = int(time.time()) + 30  # 30 seconds in the future
                 queue_item.times_queued += 1
-                add_to_queue(queue_item)
+                
+                # Add the URLPrefix to the parser generation queue and put the URLQueueItem back, in one round trip
+                await add_to_queues([prefix_obj, queue_item])
                 
                 logger.info(f"Re-queued URL {queue_item.url.url} for processing in 30 seconds (times_queued: {queue_item.times_queued})")
                 return {
@@ -357,46 +474,55 @@ class ParsingWorker:
     async def run(self):
         """Main worker loop - continuously process URLQueueItems from queue"""
         logger.info("Starting parsing worker...")
+        idle_wait = IDLE_WAIT_MIN_SECONDS
         
         while True:
             try:
                 # Check system state before processing
-                if not is_system_running():
+                if not await is_system_running():
                     logger.info("System is paused, waiting...")
                     await asyncio.sleep(1)
                     continue
                 
-                # Get URLQueueItem from queue using redis_queue functionality
-                queue_item = get_from_queue(URLQueueItem)
+                # Take up to PREFETCH URLQueueItems from the queue in one round trip
+                queue_items = await get_many_from_queue(URLQueueItem, PREFETCH)
                 
-                if queue_item is None:
-                    # No URLQueueItem available, wait a bit before checking again
-                    await asyncio.sleep(1)
+                if not queue_items:
+                    # No URLQueueItem available, wait a bit before checking again, backing off while the queue stays empty
+                    await asyncio.sleep(idle_wait)
+                    idle_wait = min(idle_wait * 2, IDLE_WAIT_MAX_SECONDS)
                     continue
                 
-                # logger.info(f"Retrieved URLQueueItem from queue: {queue_item.url.url}")
+                # Process the URLQueueItems concurrently; their page fetches overlap
+                results = await asyncio.gather(*(self.process_url_queue_item(queue_item) for queue_item in queue_items))
                 
-                # Process the URLQueueItem
-                result = await self.process_url_queue_item(queue_item)
+                should_sleep = False
                 
-                should_sleep = True
-
-                if result["status"] == "success":
-                    logger.info(f"Successfully processed URL: {queue_item.url.url}")
-                elif result["status"] == "deferred":
-                    should_sleep = False
-                elif result["status"] == "requeued":
-                    logger.info(f"Re-queued URL: {queue_item.url.url} - {result.get('reason')}")
-                elif result["status"] == "skipped":
-                    logger.info(f"Skipped URL: {queue_item.url.url} - {result.get('reason')}")
-                elif result["status"] == "dropped":
-                    should_sleep = False
-                    logger.info(f"Dropped URL: {queue_item.url.url} - {result.get('reason')}")
-                else:
-                    logger.error(f"Failed to process URL: {queue_item.url.url} - {result.get('error')}")
+                for queue_item, result in zip(queue_items, results):
+                    if result["status"] not in ("deferred", "dropped"):
+                        should_sleep = True
+                    
+                    if result["status"] == "success":
+                        logger.info(f"Successfully processed URL: {queue_item.url.url}")
+                    elif result["status"] == "requeued":
+                        logger.info(f"Re-queued URL: {queue_item.url.url} - {result.get('reason')}")
+                    elif result["status"] == "skipped":
+                        logger.info(f"Skipped URL: {queue_item.url.url} - {result.get('reason')}")
+                    elif result["status"] == "dropped":
+                        logger.info(f"Dropped URL: {queue_item.url.url} - {result.get('reason')}")
+                    elif result["status"] != "deferred":
+                        logger.error(f"Failed to process URL: {queue_item.url.url} - {result.get('error')}")
+                
+                if all(result["status"] == "deferred" for result in results):
+                    # Only items that aren't due yet, which went straight back on the queue: back off as for an empty queue
+                    await asyncio.sleep(idle_wait)
+                    idle_wait = min(idle_wait * 2, IDLE_WAIT_MAX_SECONDS)
+                    continue
+                idle_wait = IDLE_WAIT_MIN_SECONDS
                 
-                # Sleep for 1 second between processing items
-                asyncio.sleep(1) if should_sleep else asyncio.sleep(0)
+                # Sleep for 1 second between processing batches
+                if should_sleep:
+                    await asyncio.sleep(1)
                 
             except KeyboardInterrupt:
                 logger.info("Received interrupt signal, shutting down...")
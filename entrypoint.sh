@@ -23,6 +23,10 @@ case "$1" in
         echo "Starting parser generation worker..."
         exec python -m workers.parser_generation_worker
         ;;
+    "reindex")
+        echo "Rebuilding the Redis indexes..."
+        exec python reindex.py
+        ;;
     "eval")
         echo "Running evaluation..."
         shift
@@ -30,7 +34,7 @@ case "$1" in
         ;;
     *)
         echo "Unknown service: $1"
-        echo "Available services: api, parsing-worker, parser-generation-worker, eval"
+        echo "Available services: api, parsing-worker, parser-generation-worker, reindex, eval"
         exit 1
         ;;
 esac